@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Match, Swipe, Message
+from .models import BackgroundTask, CustomUser, EmbeddingCache, EmbeddingCacheStats, EmbeddingJob, GeocodeCache, Match, Swipe, Message, Tag
 
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
@@ -15,4 +15,10 @@ class CustomUserAdmin(UserAdmin):
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Match)
 admin.site.register(Swipe)
-admin.site.register(Message)
\ No newline at end of file
+admin.site.register(Message)
+admin.site.register(EmbeddingJob)
+admin.site.register(EmbeddingCache)
+admin.site.register(EmbeddingCacheStats)
+admin.site.register(GeocodeCache)
+admin.site.register(BackgroundTask)
+admin.site.register(Tag)
\ No newline at end of file
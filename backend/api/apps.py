@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        # Registers the system checks and the background task handlers.
+        from . import checks, tasks  # noqa: F401
@@ -0,0 +1,18 @@
+import os
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def check_geocoding_source(app_configs, **kwargs):
+    """Without a GeoNames dump or the remote fallback, no profile gets a city."""
+    if settings.GEOCODE_REMOTE_FALLBACK or os.path.isfile(settings.GEONAMES_CITIES_FILE):
+        return []
+    return [
+        Warning(
+            f"No reverse geocoding source: {settings.GEONAMES_CITIES_FILE} does not exist "
+            "and GEOCODE_REMOTE_FALLBACK is off.",
+            hint="Run `manage.py fetch_geonames`, or set GEOCODE_REMOTE_FALLBACK=1.",
+            id="api.W001",
+        )
+    ]
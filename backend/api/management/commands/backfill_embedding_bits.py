@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Case, Value, When
+from django.db.models.functions import Cast
+from pgvector.django import BitField
+
+from api.models import CustomUser, embedding_sign_bits
+from api.utils_embeddings import load_embeddings
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills embedding_bits for profiles embedded before the column existed, one short "
+        "transaction per batch. Safe to interrupt and re-run, and to run next to the workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        pending = CustomUser.objects.filter(profile_embedding__isnull=False, embedding_bits__isnull=True)
+        filled, last_id = 0, 0
+        started = time.monotonic()
+
+        while batch := list(
+            pending.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:options["batch_size"]]
+        ):
+            last_id = batch[-1]
+            ids, matrix = load_embeddings(CustomUser.objects.filter(id__in=batch))
+            bits = Case(
+                *[
+                    When(id=user_id, then=Cast(Value(embedding_sign_bits(row)), BitField(length=768)))
+                    for user_id, row in zip(ids, matrix)
+                ],
+                output_field=BitField(length=768),
+            )
+            # Still NULL only: a profile re-embedded meanwhile already got its bits from the writer.
+            filled += pending.filter(id__in=ids).update(embedding_bits=bits)
+            self.stdout.write(f"{filled} profiles filled (up to id {last_id})")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"Filled embedding_bits for {filled} profiles in {elapsed:.1f}s")
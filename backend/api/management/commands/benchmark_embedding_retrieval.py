@@ -0,0 +1,87 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import CustomUser, embedding_sign_bits
+from api.utils_embeddings import dot_rows, l2_normalize_rows, load_embeddings
+from api.views import ANN_CANDIDATES, PotentialMatchesView
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares feed embedding retrieval (HNSW index, and the quantized Hamming shortlist with exact "
+        "re-rank at several oversampling factors) against exact dot() ranking: recall of the top "
+        "ANN_CANDIDATES and latency. Uses synthetic users in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20000)
+        parser.add_argument("--queries", type=int, default=20)
+        parser.add_argument("--clusters", type=int, default=50, help="Interest clusters the embeddings are drawn from.")
+        parser.add_argument("--oversampling", default="1,2,4,8", help="Comma-separated shortlist factors.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        centers = rng.standard_normal((options["clusters"], 768))
+        view = PotentialMatchesView()
+
+        with transaction.atomic():
+            self._create_users(rng, centers, "bench_candidate", options["users"], gender="F", interested_in=["M"])
+            viewers = self._create_users(rng, centers, "bench_viewer", options["queries"], gender="M", interested_in=["F"])
+            viewers = list(CustomUser.objects.filter(id__in=[v.id for v in viewers]))
+
+            methods = {"hnsw": lambda user, queryset: view._get_nearest_by_embedding(user, queryset)}
+            for factor in (int(f) for f in options["oversampling"].split(",")):
+                methods[f"bits x{factor}"] = (
+                    lambda user, queryset, factor=factor: view._get_nearest_by_quantized(user, queryset, factor)
+                )
+
+            recalls = {name: [] for name in methods}
+            timings = {name: [] for name in methods}
+            exact_timings = []
+            for viewer in viewers:
+                queryset = view._candidate_queryset(viewer)
+
+                started = time.perf_counter()
+                ids, matrix = load_embeddings(queryset)
+                scores = dot_rows(matrix, viewer.profile_embedding)
+                exact = {ids[i] for i in np.argsort(-scores, kind="stable")[:ANN_CANDIDATES]}
+                exact_timings.append(time.perf_counter() - started)
+
+                for name, method in methods.items():
+                    started = time.perf_counter()
+                    found = method(viewer, queryset)
+                    timings[name].append(time.perf_counter() - started)
+                    recalls[name].append(len(exact & {row["id"] for row in found}) / len(exact))
+
+            self.stdout.write(f"{options['users']} candidates, top {ANN_CANDIDATES}, {options['queries']} queries")
+            self.stdout.write(f"{'method':>10} {'recall':>8} {'p50':>10} {'p95':>10}")
+            self.stdout.write(self._row("exact", [1.0], exact_timings))
+            for name in methods:
+                self.stdout.write(self._row(name, recalls[name], timings[name]))
+
+            transaction.set_rollback(True)
+
+    def _create_users(self, rng, centers, prefix, count, **fields):
+        users = []
+        for start in range(0, count, BATCH_SIZE):
+            size = min(BATCH_SIZE, count - start)
+            cluster = centers[rng.integers(len(centers), size=size)]
+            embeddings = l2_normalize_rows((cluster + 0.5 * rng.standard_normal((size, 768))).astype(np.float32))
+            users += CustomUser.objects.bulk_create([
+                CustomUser(
+                    username=f"{prefix}_{start + i}", email=f"{prefix}_{start + i}@bench.invalid",
+                    password="!", profile_embedding=embedding,
+                    embedding_bits=embedding_sign_bits(embedding), **fields,
+                )
+                for i, embedding in enumerate(embeddings)
+            ])
+        return users
+
+    def _row(self, name, recalls, timings):
+        p50, p95 = np.percentile(timings, [50, 95]) * 1000
+        return f"{name:>10} {np.mean(recalls):>8.3f} {p50:>8.1f}ms {p95:>8.1f}ms"
@@ -0,0 +1,73 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from api.models import CustomUser
+from api.serializers import DatingProfileSerializer, dating_profiles
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Times serializing feed profiles with DatingProfileSerializer against the values()-based "
+        "dating_profiles() path. Uses synthetic users in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="20,100,1000,5000", help="Comma-separated profile counts.")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options["sizes"].split(","))
+        request = RequestFactory().get("/api/dating/potential-matches/", HTTP_HOST="localhost")
+
+        self.stdout.write(f"{'profiles':>8} {'serializer':>12} {'values':>12} {'speedup':>8}")
+        with transaction.atomic():
+            ids = [
+                user.id
+                for user in CustomUser.objects.bulk_create(
+                    [
+                        CustomUser(
+                            username=f"bench_profile_{i}", email=f"bench_profile_{i}@bench.invalid", password="!",
+                            first_name="Bench", last_name=str(i), age=20 + i % 30, gender="F",
+                            city="Warsaw", country="Poland", occupation="Engineer", bio="Bio " * 20,
+                            tags=["python", "travel", "hiking"],
+                            profile_picture=f"profile_pics/{i}.jpg" if i % 2 else None,
+                        )
+                        for i in range(sizes[-1])
+                    ],
+                    batch_size=BATCH_SIZE,
+                )
+            ]
+
+            for size in sizes:
+                queryset = CustomUser.objects.filter(id__in=ids[:size])
+
+                def drf():
+                    users = queryset.defer("profile_embedding")
+                    return DatingProfileSerializer(users, many=True, context={"request": request}).data
+
+                def values():
+                    return dating_profiles(queryset, request)
+
+                if sorted(drf(), key=lambda p: p["id"]) != sorted(values().values(), key=lambda p: p["id"]):
+                    self.stderr.write(f"Outputs differ at {size} profiles")
+
+                drf_time = self._best(drf, options["repeat"])
+                values_time = self._best(values, options["repeat"])
+                self.stdout.write(
+                    f"{size:>8} {drf_time * 1000:>10.1f}ms {values_time * 1000:>10.1f}ms "
+                    f"{drf_time / values_time:>7.1f}x"
+                )
+
+            transaction.set_rollback(True)
+
+    def _best(self, func, repeat):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        return best
@@ -0,0 +1,108 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+
+from api.models import CustomUser, Swipe
+from api.views import MAX_CANDIDATES, PotentialMatchesView
+
+BATCH_SIZE = 5000
+
+
+class LegacyExclusionView(PotentialMatchesView):
+    """The feed query as it was before the anti-join: NOT IN (subquery)."""
+
+    def _exclude_swiped(self, user, queryset):
+        return queryset.exclude(id__in=Swipe.objects.filter(actor=user).values_list("target_id", flat=True))
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the feed candidate query as the viewer's swipe count grows, for the NOT EXISTS "
+        "anti-join and the old NOT IN subquery. Uses synthetic users in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--steps", default="0,1000,10000,100000", help="Comma-separated swipe counts.")
+        parser.add_argument("--unswiped", type=int, default=1000, help="Candidates left after the largest step.")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--work-mem", help="Postgres work_mem for the run, e.g. 1MB.")
+        parser.add_argument("--statement-timeout", default="60s", help="Per-query limit; slower runs print as timeouts.")
+
+    def handle(self, *args, **options):
+        steps = sorted(int(step) for step in options["steps"].split(","))
+        views = {"not exists": PotentialMatchesView(), "not in": LegacyExclusionView()}
+
+        self.stdout.write(
+            f"{'swipes':>8} {'candidates':>11}"
+            + "".join(f" {name + ' db':>14} {name + ' feed':>16}" for name in views)
+        )
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", [options["statement_timeout"]])
+                if options["work_mem"]:
+                    cursor.execute("SELECT set_config('work_mem', %s, true)", [options["work_mem"]])
+
+            viewer = self._create_users("bench_viewer", 1, gender="M", interested_in=["F"])[0]
+            targets = [
+                user.id
+                for user in self._create_users(
+                    "bench_target", steps[-1] + options["unswiped"], gender="F", interested_in=["M"]
+                )
+            ]
+
+            swiped = 0
+            for step in steps:
+                Swipe.objects.bulk_create(
+                    [Swipe(actor=viewer, target_id=target_id, action=Swipe.Action.PASS) for target_id in targets[swiped:step]],
+                    batch_size=BATCH_SIZE,
+                )
+                swiped = step
+                with connection.cursor() as cursor:
+                    cursor.execute(f"ANALYZE {Swipe._meta.db_table}")
+                    cursor.execute(f"ANALYZE {CustomUser._meta.db_table}")
+
+                row = ""
+                count = None
+                for view in views.values():
+                    try:
+                        with transaction.atomic():
+                            db_time = self._db_time(view, viewer, options["repeat"])
+                            feed_time, count = self._feed_time(view, viewer, options["repeat"])
+                        row += f" {db_time * 1000:>12.1f}ms {feed_time * 1000:>14.1f}ms"
+                    except OperationalError:
+                        row += f" {'timeout':>14} {'timeout':>16}"
+                self.stdout.write(f"{step:>8} {count if count is not None else '-':>11}" + row)
+
+            transaction.set_rollback(True)
+
+    def _create_users(self, prefix, count, **fields):
+        return CustomUser.objects.bulk_create(
+            [
+                CustomUser(username=f"{prefix}_{i}", email=f"{prefix}_{i}@bench.invalid", password="!", **fields)
+                for i in range(count)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+    def _db_time(self, view, viewer, repeat):
+        """Server-side execution time of the candidate query, without fetching rows into Python."""
+        sql, params = view._candidate_queryset(viewer)[:MAX_CANDIDATES].query.sql_with_params()
+        best = float("inf")
+        with connection.cursor() as cursor:
+            for _ in range(repeat):
+                cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                best = min(best, plan[0]["Execution Time"] / 1000)
+        return best
+
+    def _feed_time(self, view, viewer, repeat):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            candidates = view._get_candidates(viewer)
+            best = min(best, time.perf_counter() - started)
+        return best, len(candidates)
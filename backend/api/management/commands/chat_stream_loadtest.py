@@ -0,0 +1,130 @@
+import asyncio
+import resource
+import statistics
+import time
+import uuid
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import CustomUser, Match, Message
+
+
+class Command(BaseCommand):
+    help = (
+        "Opens many concurrent chat SSE streams against a running server and reports delivery latency. "
+        "Streams and the measured message use a throwaway pair of users, deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000/api/chat/stream/async/")
+        parser.add_argument("--clients", type=int, default=1000)
+        parser.add_argument("--hold", type=float, default=10.0, help="Seconds to keep the streams open.")
+        parser.add_argument("--connect-concurrency", type=int, default=200)
+
+    def handle(self, *args, **options):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = min(hard, options["clients"] + 256)
+        if soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+        # The server has to see them, so they are committed rather than rolled back, and the
+        # message from the partner, sent once every stream is open, measures fan-out latency.
+        user, partner = self._create_users()
+        try:
+            low, high = Match.ordered_pair(user.id, partner.id)
+            match = Match.objects.create(user_low_id=low, user_high_id=high)
+            match.users.add(user, partner)
+
+            token = str(AccessToken.for_user(user))
+            stats = asyncio.run(self._run(options, token, match, partner))
+        finally:
+            # Cascades to the match and its messages.
+            CustomUser.objects.filter(id__in=[user.id, partner.id]).delete()
+
+        self.stdout.write(f"connected={stats['connected']} failed={stats['failed']}")
+        latencies = stats["latencies"]
+        if latencies:
+            p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+            self.stdout.write(
+                f"delivered={len(latencies)} p50={statistics.median(latencies) * 1000:.1f}ms "
+                f"p95={p95 * 1000:.1f}ms"
+            )
+
+    def _create_users(self):
+        run = uuid.uuid4().hex[:12]
+        return [
+            CustomUser.objects.create_user(
+                username=f"loadtest_{role}_{run}", email=f"loadtest_{role}_{run}@loadtest.invalid", password=None
+            )
+            for role in ("listener", "sender")
+        ]
+
+    async def _run(self, options, token, match, partner):
+        url = urlsplit(options["url"])
+        request = (
+            f"GET {url.path or '/'} HTTP/1.1\r\n"
+            f"Host: {url.netloc}\r\n"
+            f"Authorization: Bearer {token}\r\n"
+            "Accept: text/event-stream\r\n\r\n"
+        ).encode()
+
+        stats = {"connected": 0, "failed": 0, "latencies": []}
+        all_connected = asyncio.Event()
+        sent_at = {}
+        gate = asyncio.Semaphore(options["connect_concurrency"])
+
+        def settled():
+            if stats["connected"] + stats["failed"] == options["clients"]:
+                all_connected.set()
+
+        async def client():
+            try:
+                async with gate:
+                    reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+                    writer.write(request)
+                    await writer.drain()
+                    status_line = await reader.readline()
+                    if b" 200 " not in status_line:
+                        raise ConnectionError(status_line.decode(errors="replace").strip())
+                    while (await reader.readline()) not in (b"\r\n", b""):
+                        pass
+            except (OSError, ConnectionError) as exc:
+                stats["failed"] += 1
+                if stats["failed"] == 1:
+                    self.stderr.write(f"First failed stream: {exc}")
+                settled()
+                return
+
+            stats["connected"] += 1
+            settled()
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    if b"data:" in line and "at" in sent_at:
+                        stats["latencies"].append(time.monotonic() - sent_at["at"])
+            finally:
+                writer.close()
+
+        async def send_message():
+            try:
+                await asyncio.wait_for(all_connected.wait(), options["hold"] / 2)
+            except asyncio.TimeoutError:
+                self.stderr.write("Not every stream connected in time; sending anyway.")
+            sent_at["at"] = time.monotonic()
+            await Message.objects.acreate(match=match, sender=partner, text="load test")
+
+        tasks = [asyncio.create_task(client()) for _ in range(options["clients"])]
+        tasks.append(asyncio.create_task(send_message()))
+
+        started = time.monotonic()
+        await asyncio.wait(tasks, timeout=options["hold"])
+        elapsed = time.monotonic() - started
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.stdout.write(f"Held streams for {elapsed:.1f}s")
+        return stats
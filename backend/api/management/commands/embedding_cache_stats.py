@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.utils_embeddings import embedding_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Prints how often profile texts were served from the embedding cache instead of Ollama."
+
+    def handle(self, *args, **options):
+        stats = embedding_cache_stats()
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} hit_rate={stats['hit_rate']:.2%}"
+        )
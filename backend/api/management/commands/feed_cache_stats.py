@@ -0,0 +1,22 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from api.utils_feed_cache import feed_cache_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints dating feed cache hit/miss counters. Needs a shared cache backend: with the "
+        "local-memory one the counters live in each server process (see the X-Feed-Cache header)."
+    )
+
+    def handle(self, *args, **options):
+        if isinstance(caches["default"], LocMemCache):
+            self.stderr.write(
+                "The cache backend is local-memory: this process cannot see the server's counters."
+            )
+        stats = feed_cache_stats()
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} hit_rate={stats['hit_rate']:.2%}"
+        )
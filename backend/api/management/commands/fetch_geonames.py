@@ -0,0 +1,43 @@
+import io
+import os
+import zipfile
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+GEONAMES_URL = "https://download.geonames.org/export/dump/"
+
+
+class Command(BaseCommand):
+    help = "Downloads the GeoNames cities dump and country names used for offline reverse geocoding."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dataset", default="cities1000",
+            help="GeoNames cities dump: cities500, cities1000, cities5000 or cities15000.",
+        )
+
+    def handle(self, *args, **options):
+        dataset = options["dataset"]
+        archive = self._download(f"{dataset}.zip")
+        with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+            self._write(settings.GEONAMES_CITIES_FILE, zf.read(f"{dataset}.txt"))
+        self._write(settings.GEONAMES_COUNTRY_INFO_FILE, self._download("countryInfo.txt"))
+        # Running processes keep the index they loaded at first use.
+        self.stdout.write("Restart the server and background workers to use the new dataset.")
+
+    def _download(self, name):
+        try:
+            response = requests.get(GEONAMES_URL + name, timeout=60)
+            response.raise_for_status()
+        except requests.RequestException as exc:
+            raise CommandError(f"Could not download {name}: {exc}")
+        return response.content
+
+    def _write(self, path, content):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Written next to the target and renamed, so a running process never reads half a file.
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(content)
+        os.replace(f"{path}.tmp", path)
+        self.stdout.write(f"Wrote {path} ({len(content) // 1024} KiB)")
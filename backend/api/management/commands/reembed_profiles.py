@@ -0,0 +1,100 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.models import CustomUser
+from api.utils_embeddings import EMBED_MODEL, embed_profiles
+from api.utils_feed_cache import invalidate_profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-embeds every profile whose embedding was not produced by the current EMBED_MODEL. "
+        "Finished batches are committed as they complete, so an interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=256)
+        parser.add_argument("--workers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        workers = options["workers"]
+
+        queryset = CustomUser.objects.exclude(embedding_model=EMBED_MODEL).only("id", "bio").order_by("id")
+        total = queryset.count()
+        self.stdout.write(f"Re-embedding {total} profiles with {EMBED_MODEL}")
+
+        # iterator() streams rows through a server-side cursor; at most 2 * workers batches are in memory.
+        rows = queryset.iterator(chunk_size=batch_size)
+        done = 0
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            in_flight = set()
+            while batch := list(islice(rows, batch_size)):
+                if len(in_flight) >= 2 * workers:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    done += self._collect(finished, done, total, started)
+                in_flight.add(pool.submit(self._reembed, batch))
+
+            if in_flight:
+                finished, _ = wait(in_flight)
+                done += self._collect(finished, done, total, started)
+
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(f"Re-embedded {done} profiles in {elapsed:.1f}s ({rate:.1f} profiles/sec)"))
+
+    def _reembed(self, users):
+        try:
+            embed_profiles(users)
+            updated = self._write_embeddings(users)
+        finally:
+            connection.close()
+
+        for user_id in updated:
+            invalidate_profile(user_id)
+        return len(users)
+
+    def _write_embeddings(self, users):
+        """One UPDATE for the batch, only where the bio is still the one that was embedded: a
+        profile edited during the run has been re-queued, and the worker's newer vector must
+        not be overwritten. Returns the ids that were written."""
+        field = CustomUser._meta.get_field("profile_embedding")
+        rows, params = [], []
+        for user in users:
+            rows.append("(%s, %s, %s::vector, %s::bit(768), %s)")
+            params += [
+                user.id, user.bio, field.get_db_prep_value(user.profile_embedding, connection),
+                user.embedding_bits, user.embedding_model,
+            ]
+
+        table = CustomUser._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {table} AS u
+                SET profile_embedding = v.embedding, embedding_bits = v.bits, embedding_model = v.model
+                FROM (VALUES {", ".join(rows)}) AS v(id, bio, embedding, bits, model)
+                WHERE u.id = v.id AND u.bio = v.bio
+                RETURNING u.id
+                """,
+                params,
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _collect(self, futures, done, total, started):
+        processed = 0
+        for future in futures:
+            try:
+                processed += future.result()
+            except Exception as exc:
+                raise CommandError(f"Batch failed, rerun the command to resume: {exc}") from exc
+
+        done += processed
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"{done}/{total} profiles ({done / elapsed:.1f} profiles/sec)")
+        return processed
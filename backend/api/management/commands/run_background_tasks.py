@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+
+from api.utils_embeddings import EMBED_BATCH_SIZE, process_embedding_jobs
+from api.utils_tasks import TASK_BATCH_SIZE, run_tasks, run_workers
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs queued background tasks (e.g. profile geocoding) and profile embedding jobs "
+        "with a bounded pool of workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--batch-size", type=int, default=TASK_BATCH_SIZE)
+        parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE)
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+        parser.add_argument("--once", action="store_true", help="Exit once both queues are drained.")
+
+    def handle(self, *args, **options):
+        def batch():
+            return run_tasks(options["batch_size"]) + process_embedding_jobs(options["embed_batch_size"])
+
+        started = time.monotonic()
+        processed = run_workers(batch, options["workers"], options["poll_interval"], options["once"])
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"Ran {processed} background tasks and embedding jobs in {elapsed:.1f}s")
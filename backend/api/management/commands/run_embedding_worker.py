@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+
+from api.utils_embeddings import EMBED_BATCH_SIZE, process_embedding_jobs
+from api.utils_tasks import run_workers
+
+
+class Command(BaseCommand):
+    help = (
+        "Processes queued profile embedding jobs only; run_background_tasks covers these too, "
+        "so a deployment needs just one of the two."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is drained.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        processed = run_workers(
+            lambda: process_embedding_jobs(options["batch_size"]),
+            options["workers"], options["poll_interval"], options["once"],
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"Processed {processed} embedding jobs in {elapsed:.1f}s")
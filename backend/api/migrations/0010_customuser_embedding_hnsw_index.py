@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:58
+
+import pgvector.django.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_customuser_max_age_diff'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['profile_embedding'], m=16, name='user_embedding_hnsw_ip', opclasses=['vector_ip_ops']),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_customuser_embedding_hnsw_index'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['latitude', 'longitude'], name='user_lat_lon_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:10
+
+from django.db import migrations, models
+
+
+def mark_existing_embeddings(apps, schema_editor):
+    # Every embedding stored so far was produced by nomic-embed-text.
+    CustomUser = apps.get_model('api', 'CustomUser')
+    CustomUser.objects.filter(profile_embedding__isnull=False).update(embedding_model='nomic-embed-text')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_embeddingcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='embedding_model',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.RunPython(mark_existing_embeddings, migrations.RunPython.noop),
+    ]
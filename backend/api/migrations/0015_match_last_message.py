@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Left
+
+
+def backfill_last_message(apps, schema_editor):
+    Match = apps.get_model('api', 'Match')
+    Message = apps.get_model('api', 'Message')
+    latest = Message.objects.filter(match=OuterRef('pk')).order_by('-id')
+    Match.objects.filter(messages__isnull=False).distinct().update(
+        last_message=Subquery(latest.values('id')[:1]),
+        last_message_at=Subquery(latest.values('timestamp')[:1]),
+        last_message_preview=Subquery(latest.annotate(preview=Left('text', 255)).values('preview')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_customuser_embedding_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.message'),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(models.OrderBy(models.F('last_message_at'), descending=True, nulls_last=True), models.OrderBy(models.F('created_at'), descending=True), condition=models.Q(('is_active', True)), name='match_recent_activity_idx'),
+        ),
+        migrations.RunPython(backfill_last_message, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_match_last_message'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['match', 'id'], name='message_match_id_idx'),
+        ),
+    ]
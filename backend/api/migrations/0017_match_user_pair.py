@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_user_pairs(apps, schema_editor):
+    # Only the oldest match of a duplicated pair gets the pair key; the others stay keyless.
+    Match = apps.get_model('api', 'Match')
+    seen = set()
+    for match in Match.objects.prefetch_related('users').order_by('id'):
+        user_ids = sorted(user.id for user in match.users.all())
+        if len(user_ids) != 2 or tuple(user_ids) in seen:
+            continue
+        seen.add(tuple(user_ids))
+        Match.objects.filter(id=match.id).update(user_low_id=user_ids[0], user_high_id=user_ids[1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_message_match_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='user_high',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='user_low',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_user_pairs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='match',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='match_unique_pair'),
+        ),
+        migrations.AddConstraint(
+            model_name='match',
+            constraint=models.CheckConstraint(condition=models.Q(('user_low__lt', models.F('user_high'))), name='match_pair_ordered'),
+        ),
+    ]
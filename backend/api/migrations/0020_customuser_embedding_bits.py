@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:02
+
+import pgvector.django.bit
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_backgroundtask_enrichment_status'),
+    ]
+
+    operations = [
+        # Nullable with no default: a catalog-only change, so the users table is not rewritten.
+        # Existing rows are filled in batches by `manage.py backfill_embedding_bits`.
+        migrations.AddField(
+            model_name='customuser',
+            name='embedding_bits',
+            field=pgvector.django.bit.BitField(blank=True, editable=False, length=768, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:25
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def intern_existing_tags(apps, schema_editor):
+    CustomUser = apps.get_model('api', 'CustomUser')
+    Tag = apps.get_model('api', 'Tag')
+    users = CustomUser.objects.exclude(tags=[]).only('id', 'tags')
+
+    names = {name for user in users.iterator(chunk_size=BATCH_SIZE) for name in user.tags or []}
+    Tag.objects.bulk_create([Tag(name=name) for name in names], batch_size=BATCH_SIZE, ignore_conflicts=True)
+    ids = dict(Tag.objects.values_list('name', 'id'))
+
+    batch = []
+    for user in users.iterator(chunk_size=BATCH_SIZE):
+        user.tag_ids = sorted({ids[name] for name in user.tags or []})
+        batch.append(user)
+        if len(batch) == BATCH_SIZE:
+            CustomUser.objects.bulk_update(batch, ['tag_ids'])
+            batch = []
+    CustomUser.objects.bulk_update(batch, ['tag_ids'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_customuser_embedding_bits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.TextField(unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='tag_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, size=None),
+        ),
+        migrations.RunPython(intern_existing_tags, migrations.RunPython.noop),
+    ]
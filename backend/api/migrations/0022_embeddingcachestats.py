@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 18:40
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def carry_over_counters(apps, schema_editor):
+    # The old scheme: one miss per cache row, hits summed over the rows.
+    EmbeddingCache = apps.get_model('api', 'EmbeddingCache')
+    EmbeddingCacheStats = apps.get_model('api', 'EmbeddingCacheStats')
+    hits = EmbeddingCache.objects.aggregate(hits=Sum('hits', default=0))['hits']
+    misses = EmbeddingCache.objects.count()
+    if hits or misses:
+        EmbeddingCacheStats.objects.create(id=1, hits=hits, misses=misses)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_tag_customuser_tag_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingCacheStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hits', models.BigIntegerField(default=0)),
+                ('misses', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(carry_over_counters, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='embeddingcache',
+            name='hits',
+        ),
+    ]
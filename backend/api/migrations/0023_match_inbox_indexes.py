@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_embeddingcachestats'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='match',
+            name='match_recent_activity_idx',
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(models.F('user_low'), models.OrderBy(models.F('last_message_at'), descending=True, nulls_last=True), models.OrderBy(models.F('created_at'), descending=True), condition=models.Q(('is_active', True)), name='match_low_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(models.F('user_high'), models.OrderBy(models.F('last_message_at'), descending=True, nulls_last=True), models.OrderBy(models.F('created_at'), descending=True), condition=models.Q(('is_active', True)), name='match_high_recent_idx'),
+        ),
+    ]
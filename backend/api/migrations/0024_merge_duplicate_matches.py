@@ -0,0 +1,51 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:30
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Left
+
+
+def merge_duplicate_matches(apps, schema_editor):
+    # 0017 gave the pair key to the oldest match of a duplicated pair only; the inbox lists
+    # matches by pair key, so the keyless duplicates' conversations move to the keyed match.
+    Match = apps.get_model('api', 'Match')
+    Message = apps.get_model('api', 'Message')
+
+    keyed = {}
+    for match_id, user_low_id, user_high_id in Match.objects.filter(user_low__isnull=False).values_list(
+        'id', 'user_low_id', 'user_high_id'
+    ):
+        keyed[(user_low_id, user_high_id)] = match_id
+
+    merged_into = set()
+    for duplicate in Match.objects.filter(user_low__isnull=True).prefetch_related('users'):
+        user_ids = tuple(sorted(user.id for user in duplicate.users.all()))
+        if len(user_ids) != 2:
+            continue
+        target = keyed.get(user_ids)
+        if target is None:
+            # Its keyed match is gone since: this one becomes the pair's match.
+            Match.objects.filter(id=duplicate.id).update(user_low_id=user_ids[0], user_high_id=user_ids[1])
+            keyed[user_ids] = duplicate.id
+            continue
+        Message.objects.filter(match_id=duplicate.id).update(match_id=target)
+        duplicate.delete()
+        merged_into.add(target)
+
+    latest = Message.objects.filter(match=OuterRef('pk')).order_by('-id')
+    Match.objects.filter(id__in=merged_into, messages__isnull=False).distinct().update(
+        last_message=Subquery(latest.values('id')[:1]),
+        last_message_at=Subquery(latest.values('timestamp')[:1]),
+        last_message_preview=Subquery(latest.annotate(preview=Left('text', 255)).values('preview')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_match_inbox_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_matches, migrations.RunPython.noop),
+    ]
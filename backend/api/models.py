@@ -1,9 +1,47 @@
+import json
 from django.contrib.auth.models import AbstractUser
-from django.db import models, connection
+from django.contrib.postgres.fields import ArrayField
+from django.db import models, connection, transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.conf import settings
-from pgvector.django import VectorField
+from django.utils import timezone
+from pgvector.django import BitField, HnswIndex, VectorField
+from .utils_feed_cache import invalidate_profile
+
+DB_NOTIFY_CHANNEL = 'chat_updates'
+MESSAGE_PREVIEW_LENGTH = 255
+
+FEED_FIELDS = {
+    'tags', 'tag_ids', 'profile_embedding', 'latitude', 'longitude',
+    'gender', 'interested_in', 'age', 'max_distance', 'max_age_diff', 'role',
+}
+
+def embedding_sign_bits(embedding) -> str | None:
+    """CustomUser.embedding_bits for an embedding: a 1 for every positive dimension."""
+    if embedding is None:
+        return None
+    return "".join("1" if x > 0 else "0" for x in embedding)
+
+class Tag(models.Model):
+    """Interned tag names, so scoring compares small integers instead of strings."""
+    name = models.TextField(unique=True)
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def intern(cls, names) -> list[int]:
+        """Sorted, distinct ids of `names`; unseen names get a new Tag."""
+        names = set(names or [])
+        if not names:
+            return []
+        ids = dict(cls.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = names - ids.keys()
+        if missing:
+            cls.objects.bulk_create([cls(name=name) for name in missing], ignore_conflicts=True)
+            ids.update(cls.objects.filter(name__in=missing).values_list('name', 'id'))
+        return sorted(ids.values())
 
 class CustomUser(AbstractUser):
     class Role(models.TextChoices):
@@ -15,6 +53,11 @@ class CustomUser(AbstractUser):
         FEMALE = 'F', 'Female'
         OTHER = 'O', 'Other'
 
+    class Enrichment(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
     email = models.EmailField(unique=True)
     role = models.CharField(max_length=20, choices=Role.choices, default=Role.USER)
     gender = models.CharField(max_length=1, choices=Gender.choices, default=Gender.OTHER)
@@ -26,25 +69,103 @@ class CustomUser(AbstractUser):
     occupation = models.CharField(max_length=100, blank=True)
     university = models.CharField(max_length=100, blank=True)
     tags = models.JSONField(default=list, blank=True)
+    # Tag ids of `tags`, kept in step by save(); what the feed scores with.
+    tag_ids = ArrayField(models.IntegerField(), default=list, blank=True)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
     city = models.CharField(max_length=100, blank=True)
     country = models.CharField(max_length=100, blank=True)
     profile_embedding = VectorField(dimensions=768, null=True, blank=True)
+    # Sign of each embedding dimension (binary quantization); 96 bytes instead of 3 KB,
+    # for the optional quantized first pass of the feed. Kept in step with profile_embedding
+    # by save() and the embedding writers; `manage.py backfill_embedding_bits` fills old rows.
+    embedding_bits = BitField(length=768, null=True, blank=True, editable=False)
+    embedding_model = models.CharField(max_length=100, blank=True)
+    # Location and embedding are filled in by background workers after the profile is saved.
+    enrichment_status = models.CharField(max_length=7, choices=Enrichment.choices, default=Enrichment.DONE)
     max_distance = models.IntegerField(default=20)
     max_age_diff = models.IntegerField(default=5)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            HnswIndex(
+                name='user_embedding_hnsw_ip',
+                fields=['profile_embedding'],
+                m=16,
+                ef_construction=64,
+                opclasses=['vector_ip_ops'],
+            ),
+            models.Index(fields=['latitude', 'longitude'], name='user_lat_lon_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        derived = set()
+        if update_fields is None or 'tags' in update_fields:
+            self.tag_ids = Tag.intern(self.tags)
+            derived.add('tag_ids')
+        if update_fields is None or 'profile_embedding' in update_fields:
+            self.embedding_bits = embedding_sign_bits(self.profile_embedding)
+            derived.add('embedding_bits')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *derived}
+        super().save(*args, **kwargs)
+
     def get_full_location(self):
         parts = [p for p in [self.city, self.country] if p]
         return ", ".join(parts)
 
+@receiver(post_save, sender=CustomUser)
+def invalidate_feed_on_profile_change(sender, instance, created, update_fields, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not FEED_FIELDS.intersection(update_fields):
+        return
+    invalidate_profile(instance.id)
+
 class Match(models.Model):
     users = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='matches')
+    # The pair ordered by id, so a pair of users can only ever have one match.
+    user_low = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE, related_name='+'
+    )
+    user_high = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE, related_name='+'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    last_message = models.ForeignKey(
+        'Message', null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=MESSAGE_PREVIEW_LENGTH, blank=True)
+
+    class Meta:
+        # One user's inbox in order, most recent activity first and matches without messages
+        # last: one index per side of the pair, since the user can be either of them.
+        indexes = [
+            models.Index(
+                models.F('user_low'),
+                models.F('last_message_at').desc(nulls_last=True), models.F('created_at').desc(),
+                name='match_low_recent_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                models.F('user_high'),
+                models.F('last_message_at').desc(nulls_last=True), models.F('created_at').desc(),
+                name='match_high_recent_idx',
+                condition=models.Q(is_active=True),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='match_unique_pair'),
+            models.CheckConstraint(
+                condition=models.Q(user_low__lt=models.F('user_high')), name='match_pair_ordered'
+            ),
+        ]
 
     def __str__(self):
         return f"Match {self.id}"
@@ -52,6 +173,10 @@ class Match(models.Model):
     def get_partner(self, user):
         return self.users.exclude(id=user.id).first()
 
+    @staticmethod
+    def ordered_pair(user_id, other_id):
+        return (user_id, other_id) if user_id < other_id else (other_id, user_id)
+
 class Swipe(models.Model):
     class Action(models.TextChoices):
         LIKE = 'LIKE', 'Like'
@@ -65,6 +190,83 @@ class Swipe(models.Model):
     class Meta:
         unique_together = ('actor', 'target')
 
+class EmbeddingJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        RUNNING = 'RUNNING', 'Running'
+        FAILED = 'FAILED', 'Failed'
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='embedding_job')
+    status = models.CharField(max_length=7, choices=Status.choices, default=Status.PENDING)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='embedding_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"EmbeddingJob {self.user_id} ({self.status})"
+
+class BackgroundTask(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        RUNNING = 'RUNNING', 'Running'
+        FAILED = 'FAILED', 'Failed'
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=7, choices=Status.choices, default=Status.PENDING)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='background_task_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"BackgroundTask {self.name} ({self.status})"
+
+class EmbeddingCache(models.Model):
+    text_hash = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=100)
+    embedding = VectorField(dimensions=768)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"EmbeddingCache {self.text_hash[:12]} ({self.model})"
+
+class EmbeddingCacheStats(models.Model):
+    """Lookup counters of EmbeddingCache, per profile text; a single row (id=1)."""
+    hits = models.BigIntegerField(default=0)
+    misses = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"EmbeddingCacheStats hits={self.hits} misses={self.misses}"
+
+class GeocodeCache(models.Model):
+    """Remote reverse-geocoding answers per rounded coordinate cell."""
+    lat_cell = models.IntegerField()
+    lon_cell = models.IntegerField()
+    city = models.CharField(max_length=100, blank=True)
+    country = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lat_cell', 'lon_cell'], name='geocode_cache_cell'),
+        ]
+
+    def __str__(self):
+        return f"GeocodeCache ({self.lat_cell}, {self.lon_cell}) {self.city}"
+
 class Message(models.Model):
     match = models.ForeignKey(Match, related_name='messages', on_delete=models.CASCADE)
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -73,12 +275,44 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Keyset pagination of one conversation's history by message id.
+            models.Index(fields=['match', 'id'], name='message_match_id_idx'),
+        ]
 
     def __str__(self):
         return f"Message {self.id} from {self.sender}"
 
+def chat_notification_payload(message):
+    recipient_ids = message.match.users.exclude(id=message.sender_id).values_list('id', flat=True)
+    return json.dumps({
+        'message_id': message.id,
+        'match_id': message.match_id,
+        'sender_id': message.sender_id,
+        'recipient_ids': list(recipient_ids),
+    })
+
+@receiver(post_save, sender=Message)
+def update_match_summary(sender, instance, created, **kwargs):
+    if created:
+        # One guarded UPDATE: a slower transaction can't overwrite a newer message's summary.
+        Match.objects.filter(
+            models.Q(last_message__isnull=True) | models.Q(last_message_id__lt=instance.id),
+            id=instance.match_id,
+        ).update(
+            last_message=instance,
+            last_message_at=instance.timestamp,
+            last_message_preview=instance.text[:MESSAGE_PREVIEW_LENGTH],
+        )
+
 @receiver(post_save, sender=Message)
 def notify_chat_update(sender, instance, created, **kwargs):
     if created:
-        with connection.cursor() as cursor:
-            cursor.execute("NOTIFY chat_updates")
\ No newline at end of file
+        payload = chat_notification_payload(instance)
+
+        def _notify():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", [DB_NOTIFY_CHANNEL, payload])
+
+        # Listeners must not see the message id before the row is committed.
+        transaction.on_commit(_notify)
\ No newline at end of file
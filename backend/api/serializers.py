@@ -31,6 +31,7 @@ class UserSerializer(serializers.ModelSerializer):
     description = serializers.CharField(source='bio', required=False, allow_blank=True)
     interestedIn = serializers.JSONField(source='interested_in', required=False)
     location = serializers.CharField(source='get_full_location', read_only=True)
+    enrichmentStatus = serializers.CharField(source='enrichment_status', read_only=True)
 
     class Meta:
         model = CustomUser
@@ -42,6 +43,7 @@ class UserSerializer(serializers.ModelSerializer):
             'location', 'latitude', 'longitude',
             'city', 'country', 'tags',
             'occupation', 'university', 'max_distance','max_age_diff',
+            'enrichmentStatus',
         )
         read_only_fields = ('role', 'username', 'email')
 
@@ -102,6 +104,41 @@ class DatingProfileSerializer(serializers.ModelSerializer):
     def get_name(self, obj):
         return obj.first_name or obj.username
 
+# Columns read by dating_profiles(); keep in step with DatingProfileSerializer's fields.
+DATING_PROFILE_COLUMNS = (
+    'id', 'profile_picture', 'first_name', 'last_name', 'username',
+    'age', 'gender', 'city', 'country', 'occupation', 'university', 'bio', 'tags',
+)
+
+def dating_profiles(queryset, request=None):
+    """DatingProfileSerializer's output for every user in `queryset`, keyed by id.
+
+    Built straight from values() rows: no model instances and no per-field DRF calls.
+    """
+    storage = User._meta.get_field('profile_picture').storage
+    profiles = {}
+    for row in queryset.values(*DATING_PROFILE_COLUMNS):
+        image = None
+        if row['profile_picture']:
+            image = storage.url(row['profile_picture'])
+            if request is not None:
+                image = request.build_absolute_uri(image)
+        profiles[row['id']] = {
+            'id': row['id'],
+            'image': image,
+            'name': row['first_name'] or row['username'],
+            'firstName': row['first_name'],
+            'lastName': row['last_name'],
+            'age': row['age'],
+            'gender': row['gender'],
+            'location': ", ".join(part for part in (row['city'], row['country']) if part),
+            'occupation': row['occupation'],
+            'university': row['university'],
+            'description': row['bio'],
+            'tags': row['tags'],
+        }
+    return profiles
+
 class SwipeActionSerializer(serializers.Serializer):
     target_id = serializers.IntegerField()
     action = serializers.ChoiceField(choices=Swipe.Action.choices)
@@ -121,7 +158,7 @@ class MessageSerializer(serializers.ModelSerializer):
 
     def get_type(self, obj):
         request = self.context.get('request')
-        is_sender = request and obj.sender == request.user
+        is_sender = request and obj.sender_id == request.user.id
         return 'outgoing' if is_sender else 'incoming'
 
 class MatchListSerializer(serializers.ModelSerializer):
@@ -136,18 +173,24 @@ class MatchListSerializer(serializers.ModelSerializer):
         model = Match
         fields = ('match_id', 'name', 'subtitle', 'time', 'message', 'avatar')
 
+    def _partner(self, obj):
+        # MyMatchesView prefetches the partner; other callers fall back to a query.
+        if hasattr(obj, 'partners'):
+            return obj.partners[0] if obj.partners else None
+        return obj.get_partner(self.context['request'].user)
+
     def get_name(self, obj):
-        partner = obj.get_partner(self.context['request'].user)
+        partner = self._partner(obj)
         if not partner:
             return "Unknown"
         return partner.first_name or partner.username
 
     def get_subtitle(self, obj):
-        partner = obj.get_partner(self.context['request'].user)
+        partner = self._partner(obj)
         return partner.occupation if partner else ""
 
     def get_avatar(self, obj):
-        partner = obj.get_partner(self.context['request'].user)
+        partner = self._partner(obj)
         if not partner or not partner.profile_picture:
             return None
 
@@ -156,9 +199,9 @@ class MatchListSerializer(serializers.ModelSerializer):
         return request.build_absolute_uri(url) if request else url
 
     def get_time(self, obj):
-        msg = obj.messages.last()
-        return f"{timesince(msg.timestamp).split(',')[0]} ago" if msg else ""
+        if not obj.last_message_at:
+            return ""
+        return f"{timesince(obj.last_message_at).split(',')[0]} ago"
 
     def get_message(self, obj):
-        msg = obj.messages.last()
-        return msg.text if msg else "New Match!"
\ No newline at end of file
+        return obj.last_message_preview if obj.last_message_at else "New Match!"
\ No newline at end of file
@@ -0,0 +1,44 @@
+from django.db.models import BigIntegerField, Exists, OuterRef
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast
+
+from .models import BackgroundTask, CustomUser, EmbeddingJob
+from .utils_geocoding import geocoded_location
+from .utils_tasks import enqueue_task, task
+
+ENRICHMENT_TASKS = ["geocode_profile"]
+
+
+def refresh_enrichment_status(user_ids) -> None:
+    """Marks pending profiles done once no enrichment work is queued for them, or failed
+    once some of it gave up."""
+    jobs = EmbeddingJob.objects.filter(user=OuterRef("pk"))
+    tasks = BackgroundTask.objects.filter(name__in=ENRICHMENT_TASKS).alias(
+        user_id=Cast(KT("kwargs__user_id"), BigIntegerField())
+    ).filter(user_id=OuterRef("pk"))
+    users = CustomUser.objects.filter(id__in=list(user_ids), enrichment_status=CustomUser.Enrichment.PENDING)
+
+    users.filter(
+        Exists(jobs.filter(status=EmbeddingJob.Status.FAILED)) |
+        Exists(tasks.filter(status=BackgroundTask.Status.FAILED))
+    ).update(enrichment_status=CustomUser.Enrichment.FAILED)
+    users.filter(~Exists(jobs), ~Exists(tasks)).update(enrichment_status=CustomUser.Enrichment.DONE)
+
+
+def queue_geocoding(user_id: int, latitude: float, longitude: float) -> None:
+    """Queues a geocode of the new coordinates, replacing any earlier ones still waiting or failed."""
+    BackgroundTask.objects.filter(name="geocode_profile", kwargs__user_id=user_id).exclude(
+        status=BackgroundTask.Status.RUNNING
+    ).delete()
+    enqueue_task("geocode_profile", user_id=user_id, latitude=latitude, longitude=longitude)
+
+
+def _geocode_failed(user_id, latitude, longitude):
+    refresh_enrichment_status([user_id])
+
+@task("geocode_profile", on_failure=_geocode_failed)
+def geocode_profile(user_id: int, latitude: float, longitude: float) -> None:
+    # A later move queues its own task; this one must not overwrite it with stale coordinates.
+    location = geocoded_location(latitude, longitude, strict=True)
+    CustomUser.objects.filter(id=user_id, latitude=latitude, longitude=longitude).update(**location)
+    refresh_enrichment_status([user_id])
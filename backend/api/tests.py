@@ -1,9 +1,64 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import requests
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
-from .models import CustomUser, Swipe
-from .utils import build_tag_vector, cosine
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+from .models import (
+    BackgroundTask,
+    CustomUser,
+    EmbeddingJob,
+    GeocodeCache,
+    Match,
+    Message,
+    Swipe,
+    Tag,
+    chat_notification_payload,
+    update_match_summary,
+)
+from .checks import check_geocoding_source
+from .management.commands.reembed_profiles import Command as ReembedCommand
+from .utils import bounding_box, build_tag_vector, cosine, distance_km, distance_km_expression
+from .utils_chat import AsyncChatBroadcaster, ChatBroadcaster
+from .utils_embeddings import (
+    EMBED_MODEL,
+    dot,
+    dot_rows,
+    embed_profiles,
+    embedding_cache_stats,
+    enqueue_profile_embedding,
+    get_profile_embeddings,
+    l2_normalize,
+    l2_normalize_rows,
+    load_embeddings,
+    process_embedding_jobs,
+)
+from .utils_feed_cache import FEED_CACHE_TTL, feed_cache_stats, get_feed_page, remove_candidate
+from .serializers import DatingProfileSerializer, dating_profiles
+from .tasks import geocode_profile, queue_geocoding
+from .utils_geocoding import CityIndex, GeocodeUnavailable, _geocode_cell, location_moved, reverse_geocode
+from .utils_scoring import WEIGHT_COSINE, WEIGHT_EMBEDDING, WEIGHT_TAGS, score_candidates
+from .utils_tasks import TASK_MAX_ATTEMPTS, enqueue_task, run_tasks
+from .views import PotentialMatchesView
 
 class UtilsTests(TestCase):
 
@@ -58,9 +113,375 @@ class UtilsTests(TestCase):
         b = [2, 1, 0]
         self.assertAlmostEqual(cosine(a, b), cosine(b, a), places=12)
 
+    def test_bounding_box_contains_circle(self):
+        lat, lon = 50.883333, 20.616667
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, 20)
+
+        self.assertAlmostEqual(distance_km(lat, lon, max_lat, lon), 20, places=6)
+        self.assertAlmostEqual(distance_km(lat, lon, min_lat, lon), 20, places=6)
+        self.assertGreaterEqual(distance_km(lat, lon, lat, max_lon), 20)
+        self.assertGreaterEqual(distance_km(lat, lon, lat, min_lon), 20)
+
+    def test_bounding_box_skips_longitude_near_antimeridian(self):
+        _, _, min_lon, max_lon = bounding_box(0.0, 179.99, 20)
+        self.assertIsNone(min_lon)
+        self.assertIsNone(max_lon)
+
+    def test_distance_km_expression_matches_python(self):
+        user = CustomUser.objects.create_user(
+            username="geo", email="geo@test.com", password="pass12345",
+            latitude=52.2297, longitude=21.0122,
+        )
+        annotated = CustomUser.objects.annotate(
+            distance=distance_km_expression(50.883333, 20.616667)
+        ).get(id=user.id)
+
+        self.assertAlmostEqual(
+            annotated.distance,
+            distance_km(50.883333, 20.616667, 52.2297, 21.0122),
+            places=6,
+        )
+
+
+GEONAMES_ROWS = [
+    # geonameid, name, asciiname, alternatenames, lat, lon, class, code, country
+    ["756135", "Warsaw", "Warsaw", "", "52.22977", "21.01178", "P", "PPLC", "PL"],
+    ["3094802", "Kraków", "Krakow", "", "50.06143", "19.93658", "P", "PPLA", "PL"],
+    ["2950159", "Berlin", "Berlin", "", "52.52437", "13.41053", "P", "PPLC", "DE"],
+    ["2194370", "Waiyevo", "Waiyevo", "", "-16.78850", "-179.98270", "P", "PPLA2", "FJ"],
+]
+
+
+class ReverseGeocodingTests(TestCase):
+    def setUp(self):
+        _geocode_cell.cache_clear()
+        self.addCleanup(_geocode_cell.cache_clear)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cities = Path(tmp.name) / "cities.txt"
+        self.cities.write_text("\n".join("\t".join(row) for row in GEONAMES_ROWS) + "\n", encoding="utf-8")
+        self.country_info = Path(tmp.name) / "countryInfo.txt"
+        self.country_info.write_text("#ISO\tISO3\tISO-Numeric\tfips\tCountry\nPL\tPOL\t616\tPL\tPoland\n")
+
+    def test_nearest_city_with_country_name(self):
+        index = CityIndex.from_geonames(self.cities, self.country_info)
+        self.assertEqual(index.nearest(52.1, 20.9), ("Warsaw", "Poland"))
+        self.assertEqual(index.nearest(50.0, 20.0), ("Kraków", "Poland"))
+        self.assertEqual(index.nearest(52.5, 13.4), ("Berlin", "DE"))
+
+    def test_nearest_across_antimeridian(self):
+        index = CityIndex.from_geonames(self.cities)
+        self.assertEqual(index.nearest(-16.8, 179.95), ("Waiyevo", "FJ"))
+
+    def test_nothing_nearby(self):
+        index = CityIndex.from_geonames(self.cities)
+        self.assertIsNone(index.nearest(0.0, 0.0))
+
+    def test_remote_fallback_only_when_enabled(self):
+        index = CityIndex.from_geonames(self.cities)
+        with mock.patch("api.utils_geocoding.get_city_index", return_value=index), \
+                mock.patch("api.utils_geocoding.reverse_geocode_city", return_value=("Null Island", "")) as remote:
+            with self.settings(GEOCODE_REMOTE_FALLBACK=False):
+                self.assertEqual(reverse_geocode(0.0, 0.0), ("", ""))
+                self.assertEqual(reverse_geocode(52.2, 21.0), ("Warsaw", "PL"))
+            remote.assert_not_called()
+
+            with self.settings(GEOCODE_REMOTE_FALLBACK=True):
+                _geocode_cell.cache_clear()
+                self.assertEqual(reverse_geocode(0.0, 0.0), ("Null Island", ""))
+
+    def test_remote_answers_are_cached_per_cell(self):
+        remote = self.enterContext(
+            mock.patch("api.utils_geocoding.reverse_geocode_city", return_value=("Null Island", ""))
+        )
+        self.enterContext(mock.patch("api.utils_geocoding.get_city_index", return_value=None))
+        self.enterContext(self.settings(GEOCODE_REMOTE_FALLBACK=True))
+
+        reverse_geocode(0.001, 0.001)
+        reverse_geocode(0.002, -0.001)
+        self.assertEqual(remote.call_count, 1)
+
+        # A restarted process still finds the answer in the table.
+        _geocode_cell.cache_clear()
+        self.assertEqual(reverse_geocode(0.0, 0.0), ("Null Island", ""))
+        self.assertEqual(remote.call_count, 1)
+        self.assertEqual(GeocodeCache.objects.count(), 1)
+
+    def test_failed_remote_lookup_is_not_cached(self):
+        self.enterContext(mock.patch("api.utils_geocoding.get_city_index", return_value=None))
+        self.enterContext(self.settings(GEOCODE_REMOTE_FALLBACK=True))
+        with mock.patch("api.utils_geocoding.reverse_geocode_city", side_effect=requests.ConnectionError):
+            self.assertEqual(reverse_geocode(0.0, 0.0), ("", ""))
+        with mock.patch("api.utils_geocoding.reverse_geocode_city", return_value=("Null Island", "")):
+            self.assertEqual(reverse_geocode(0.0, 0.0), ("Null Island", ""))
+
+    def test_no_source_is_unavailable_rather_than_blank(self):
+        self.enterContext(mock.patch("api.utils_geocoding.get_city_index", return_value=None))
+        self.enterContext(self.settings(GEOCODE_REMOTE_FALLBACK=False))
+        user = CustomUser.objects.create_user(
+            username="kept", email="kept@test.com", password="pass12345",
+            latitude=52.2, longitude=21.0, city="Warsaw", country="Poland",
+        )
+
+        self.assertEqual(reverse_geocode(52.2, 21.0), ("", ""))
+        with self.assertRaises(GeocodeUnavailable):
+            geocode_profile(user_id=user.id, latitude=52.2, longitude=21.0)
+        user.refresh_from_db()
+        self.assertEqual((user.city, user.country), ("Warsaw", "Poland"))
+
+    def test_missing_source_is_reported_by_system_check(self):
+        with self.settings(GEONAMES_CITIES_FILE=str(self.cities.with_name("missing.txt"))):
+            with self.settings(GEOCODE_REMOTE_FALLBACK=False):
+                self.assertEqual([w.id for w in check_geocoding_source(None)], ["api.W001"])
+            with self.settings(GEOCODE_REMOTE_FALLBACK=True):
+                self.assertEqual(check_geocoding_source(None), [])
+        with self.settings(GEONAMES_CITIES_FILE=str(self.cities), GEOCODE_REMOTE_FALLBACK=False):
+            self.assertEqual(check_geocoding_source(None), [])
+
+    def test_fetch_geonames_writes_the_configured_files(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("cities1000.txt", self.cities.read_text(encoding="utf-8"))
+        downloads = {
+            "cities1000.zip": archive.getvalue(),
+            "countryInfo.txt": self.country_info.read_bytes(),
+        }
+
+        def fake_get(url, timeout):
+            return mock.Mock(content=downloads[url.rsplit("/", 1)[1]], raise_for_status=lambda: None)
+
+        target = self.cities.parent / "data"
+        with mock.patch("api.management.commands.fetch_geonames.requests.get", fake_get), self.settings(
+            GEONAMES_CITIES_FILE=str(target / "cities1000.txt"),
+            GEONAMES_COUNTRY_INFO_FILE=str(target / "countryInfo.txt"),
+        ):
+            call_command("fetch_geonames", stdout=StringIO())
+
+        index = CityIndex.from_geonames(target / "cities1000.txt", target / "countryInfo.txt")
+        self.assertEqual(index.nearest(52.1, 20.9), ("Warsaw", "Poland"))
+
+    def test_location_moved_threshold(self):
+        self.assertTrue(location_moved(None, None, 52.2, 21.0))
+        self.assertFalse(location_moved(52.2, 21.0, 52.2001, 21.0001))
+        self.assertTrue(location_moved(52.2, 21.0, 52.3, 21.0))
+        self.assertFalse(location_moved(52.2, 21.0, None, None))
+
+
+class ProfileLocationTests(APITestCase):
+    def setUp(self):
+        _geocode_cell.cache_clear()
+        self.addCleanup(_geocode_cell.cache_clear)
+        self.user = CustomUser.objects.create_user(
+            username="loc", email="loc@test.com", password="pass12345",
+            latitude=52.2, longitude=21.0, city="Warsaw", country="Poland",
+        )
+        self.client.force_authenticate(self.user)
+        self.geocode = self.enterContext(
+            mock.patch("api.utils_geocoding._geocode_cell", return_value=("Kraków", "Poland"))
+        )
+
+    def test_bio_only_update_does_not_geocode(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(reverse("profile"), {"description": "new bio"}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["enrichmentStatus"], CustomUser.Enrichment.PENDING)
+        self.assertFalse(BackgroundTask.objects.exists())
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE \"api_customuser\"")]
+        self.assertEqual(len(updates), 1)
+
+    def test_move_is_geocoded_in_the_background(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(reverse("profile"), {"latitude": 50.06, "longitude": 19.94}, format="json")
+
+        self.geocode.assert_not_called()
+        self.assertEqual(response.data["enrichmentStatus"], CustomUser.Enrichment.PENDING)
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE \"api_customuser\"")]
+        self.assertEqual(len(updates), 1)
+
+        self.assertEqual(run_tasks(), 1)
+        self.geocode.assert_called_once()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.city, "Kraków")
+        self.assertEqual(self.user.enrichment_status, CustomUser.Enrichment.DONE)
+
+    def test_profile_without_city_is_geocoded_again_on_save(self):
+        CustomUser.objects.filter(id=self.user.id).update(
+            city="", country="", enrichment_status=CustomUser.Enrichment.FAILED
+        )
+        self.user.refresh_from_db()
+
+        response = self.client.patch(reverse("profile"), {"description": "new bio"}, format="json")
+        self.assertEqual(response.data["enrichmentStatus"], CustomUser.Enrichment.PENDING)
+
+        run_tasks()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.city, "Kraków")
+        self.assertEqual(self.user.enrichment_status, CustomUser.Enrichment.PENDING)
+
+    def test_stale_geocode_does_not_overwrite_a_newer_move(self):
+        self.client.patch(reverse("profile"), {"latitude": 50.06, "longitude": 19.94}, format="json")
+        self.client.patch(reverse("profile"), {"latitude": 54.35, "longitude": 18.65}, format="json")
+
+        self.assertEqual(BackgroundTask.objects.count(), 1)
+        geocode_profile(user_id=self.user.id, latitude=50.06, longitude=19.94)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.city, "Warsaw")
+
+
+class BackgroundTaskTests(APITestCase):
+    def setUp(self):
+        _geocode_cell.cache_clear()
+        self.addCleanup(_geocode_cell.cache_clear)
+        self.user = CustomUser.objects.create_user(
+            username="bg", email="bg@test.com", password="pass12345",
+            latitude=52.2, longitude=21.0, enrichment_status=CustomUser.Enrichment.PENDING,
+        )
+
+    def test_unknown_task_is_rejected(self):
+        with self.assertRaises(ValueError):
+            enqueue_task("no_such_task")
+
+    def test_failed_task_is_retried_then_marks_profile_failed(self):
+        queue_geocoding(self.user.id, 52.2, 21.0)
+        with mock.patch("api.utils_geocoding._geocode_cell", side_effect=GeocodeUnavailable):
+            self.assertEqual(run_tasks(), 1)
+            task = BackgroundTask.objects.get()
+            self.assertEqual(task.status, BackgroundTask.Status.PENDING)
+            self.assertEqual(task.attempts, 1)
+            self.assertEqual(run_tasks(), 0)
+
+            for _ in range(TASK_MAX_ATTEMPTS - 1):
+                BackgroundTask.objects.update(run_after=timezone.now())
+                run_tasks()
+
+        self.assertEqual(BackgroundTask.objects.get().status, BackgroundTask.Status.FAILED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.enrichment_status, CustomUser.Enrichment.FAILED)
+
+    def test_profile_stays_pending_until_embedding_is_done(self):
+        enqueue_profile_embedding(self.user.id)
+        queue_geocoding(self.user.id, 52.2, 21.0)
+
+        with mock.patch("api.utils_geocoding._geocode_cell", return_value=("Warsaw", "Poland")):
+            run_tasks()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.city, "Warsaw")
+        self.assertEqual(self.user.enrichment_status, CustomUser.Enrichment.PENDING)
+
+        start_fake_ollama(self)
+        process_embedding_jobs()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.enrichment_status, CustomUser.Enrichment.DONE)
+
+    def test_registration_returns_before_enrichment(self):
+        with mock.patch("api.utils_geocoding._geocode_cell") as geocode:
+            response = self.client.post(
+                reverse("register"),
+                {
+                    "username": "newbie", "email": "newbie@test.com", "password": "pass12345",
+                    "firstName": "New", "lastName": "User", "interestedIn": ["F"],
+                    "latitude": 50.06, "longitude": 19.94,
+                },
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        geocode.assert_not_called()
+        user = CustomUser.objects.get(username="newbie")
+        self.assertEqual(user.enrichment_status, CustomUser.Enrichment.PENDING)
+        self.assertTrue(BackgroundTask.objects.filter(name="geocode_profile", kwargs__user_id=user.id).exists())
+        self.assertTrue(EmbeddingJob.objects.filter(user=user).exists())
+
+
+class BackgroundWorkerCommandTests(TransactionTestCase):
+    def test_one_worker_drains_tasks_and_embedding_jobs(self):
+        start_fake_ollama(self)
+        _geocode_cell.cache_clear()
+        self.addCleanup(_geocode_cell.cache_clear)
+        user = CustomUser.objects.create_user(
+            username="worker", email="worker@test.com", password="pass12345", bio="hiking",
+            latitude=52.2, longitude=21.0, enrichment_status=CustomUser.Enrichment.PENDING,
+        )
+        queue_geocoding(user.id, 52.2, 21.0)
+        enqueue_profile_embedding(user.id)
+
+        out = StringIO()
+        with mock.patch("api.utils_geocoding._geocode_cell", return_value=("Warsaw", "Poland")):
+            call_command("run_background_tasks", once=True, workers=2, stdout=out)
+
+        self.assertIn("Ran 2 ", out.getvalue())
+        self.assertFalse(BackgroundTask.objects.exists() or EmbeddingJob.objects.exists())
+        user.refresh_from_db()
+        self.assertEqual(user.city, "Warsaw")
+        self.assertIsNotNone(user.profile_embedding)
+        self.assertEqual(user.enrichment_status, CustomUser.Enrichment.DONE)
+
+
+class ScoringKernelTests(TestCase):
+
+    def setUp(self):
+        self.user_tags = ["python", "fitness", "travel", "python"]
+        self.candidate_tags = [
+            ["python", "netflix"],
+            ["travel"],
+            ["python", "fitness", "netflix", "fitness"],
+            [],
+            None,
+            ["cooking", "hiking"],
+            ["travel", "python", "fitness"],
+        ]
+        self.user_tag_ids = Tag.intern(self.user_tags)
+        self.candidate_tag_ids = [tags if tags is None else Tag.intern(tags) for tags in self.candidate_tags]
+
+    def test_score_candidates_matches_per_candidate_formula(self):
+        emb_scores = [0.25, -0.1, 0.0, 0.9, 0.0, 0.33, 1.0]
+        scores = score_candidates(self.user_tag_ids, self.candidate_tag_ids, emb_scores)
+
+        all_tags = self.user_tags + [tag for tags in self.candidate_tags for tag in (tags or [])]
+        vocab = sorted(set(all_tags))
+        user_vector = build_tag_vector(self.user_tags, vocab)
+
+        for i, tags in enumerate(self.candidate_tags):
+            common = len(set(self.user_tags) & set(tags or []))
+            cosine_score = cosine(user_vector, build_tag_vector(tags, vocab))
+            final = WEIGHT_TAGS * common + WEIGHT_COSINE * cosine_score + WEIGHT_EMBEDDING * emb_scores[i]
+
+            self.assertEqual(scores["common"][i], common)
+            self.assertEqual(scores["cosine"][i], cosine_score)
+            self.assertEqual(scores["final"][i], final)
+
+    def test_score_candidates_user_without_tags(self):
+        scores = score_candidates([], self.candidate_tag_ids, [0.0] * len(self.candidate_tags))
+        self.assertEqual(scores["common"].tolist(), [0] * len(self.candidate_tags))
+        self.assertEqual(scores["cosine"].tolist(), [0.0] * len(self.candidate_tags))
+
+    def test_score_candidates_empty_pool(self):
+        scores = score_candidates(self.user_tag_ids, [], [])
+        self.assertEqual(len(scores["final"]), 0)
+
+    def test_intern_returns_stable_distinct_ids(self):
+        ids = Tag.intern(["python", "travel", "python"])
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(Tag.intern(["travel", "python"]), ids)
+        self.assertEqual(Tag.intern(None), [])
+
+    def test_profile_save_keeps_tag_ids_in_step(self):
+        user = CustomUser.objects.create_user(
+            username="tagged", email="tagged@test.com", password="pass12345", tags=["python", "hiking"]
+        )
+        self.assertEqual(user.tag_ids, Tag.intern(["python", "hiking"]))
+
+        user.tags = ["cooking"]
+        user.save(update_fields=["tags"])
+        user.refresh_from_db()
+        self.assertEqual(user.tag_ids, Tag.intern(["cooking"]))
+
 
 class FeedDebugTests(APITestCase):
     def setUp(self):
+        cache.clear()
         self.me = CustomUser.objects.create_user(
             username="me", email="me@test.com", password="pass12345"
         )
@@ -212,3 +633,844 @@ class FeedDebugTests(APITestCase):
         returned_ids = [item["user"]["id"] for item in res.data]
         self.assertNotIn(self.u1.id, returned_ids)
 
+    def test_feed_scores_embedding_similarity_in_database(self):
+        embedding = [1.0] + [0.0] * 767
+        self.me.profile_embedding = embedding
+        self.me.save()
+
+        self.u2.profile_embedding = embedding
+        self.u2.save()
+
+        self.u1.profile_embedding = [0.0, 1.0] + [0.0] * 766
+        self.u1.save()
+
+        url = reverse("potential_matches")
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        emb_by_id = {item["user"]["id"]: item["emb"] for item in res.data}
+        self.assertAlmostEqual(emb_by_id[self.u2.id], 1.0, places=4)
+        self.assertAlmostEqual(emb_by_id[self.u1.id], 0.0, places=4)
+        self.assertAlmostEqual(emb_by_id[self.u3.id], 0.0, places=4)
+
+    def test_feed_second_request_is_served_from_cache(self):
+        url = reverse("potential_matches")
+        first = self.client.get(url)
+        second = self.client.get(url)
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first["X-Feed-Cache"], "miss")
+        self.assertEqual(second["X-Feed-Cache"], "hit")
+        self.assertEqual(feed_cache_stats()["misses"], 1)
+        self.assertEqual(feed_cache_stats()["hits"], 1)
+
+    def test_swipe_removes_candidate_from_cached_feed(self):
+        url = reverse("potential_matches") + "?page_size=2"
+        self.client.get(url)
+
+        self.client.post(reverse("swipe"), {"target_id": self.u3.id, "action": "PASS"}, format="json")
+        res = self.client.get(url)
+
+        returned_ids = [item["user"]["id"] for item in res.data]
+        self.assertNotIn(self.u3.id, returned_ids)
+        self.assertEqual(feed_cache_stats()["hits"], 1)
+
+    def test_feed_swiped_to_the_end_is_recomputed(self):
+        url = reverse("potential_matches")
+        self.client.get(url)
+        for user in (self.u1, self.u2, self.u3):
+            self.client.post(reverse("swipe"), {"target_id": user.id, "action": "PASS"}, format="json")
+        newcomer = CustomUser.objects.create_user(
+            username="newcomer", email="newcomer@test.com", password="pass12345",
+            gender="F", interested_in=["M"],
+        )
+
+        res = self.client.get(url)
+        self.assertEqual(res["X-Feed-Cache"], "miss")
+        self.assertEqual([item["user"]["id"] for item in res.data], [newcomer.id])
+
+    def test_swipe_keeps_the_cached_feed_expiry(self):
+        self.client.get(reverse("potential_matches"))
+        later = time.time() + 600
+        with mock.patch("api.utils_feed_cache.time.time", return_value=later), \
+                mock.patch("api.utils_feed_cache.cache.set", wraps=cache.set) as cache_set:
+            remove_candidate(self.me.id, self.u3.id)
+
+        timeout = cache_set.call_args.args[2]
+        self.assertLessEqual(timeout, FEED_CACHE_TTL - 600)
+        self.assertGreater(timeout, FEED_CACHE_TTL - 660)
+
+    def test_swiped_users_are_excluded_from_candidates(self):
+        Swipe.objects.create(actor=self.me, target=self.u1, action="LIKE")
+        Swipe.objects.create(actor=self.u2, target=self.me, action="PASS")
+
+        candidate_ids = {c["id"] for c in PotentialMatchesView()._get_candidates(self.me)}
+        self.assertNotIn(self.u1.id, candidate_ids)
+        self.assertIn(self.u2.id, candidate_ids)
+
+    def test_candidates_load_only_ranking_columns(self):
+        self.me.profile_embedding = [1.0] + [0.0] * 767
+        self.me.save()
+        self.u1.profile_embedding = [1.0] + [0.0] * 767
+        self.u1.save()
+
+        with CaptureQueriesContext(connection) as ctx:
+            candidates = PotentialMatchesView()._get_candidates(self.me)
+
+        self.assertEqual({c["id"] for c in candidates}, {self.u1.id, self.u2.id, self.u3.id})
+        self.assertTrue(all(set(c) == {"id", "tag_ids", "emb"} for c in candidates))
+        selects = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+        for sql in selects:
+            columns = sql[:sql.index(" FROM ")]
+            for column in ("password", "bio", "profile_picture"):
+                self.assertNotIn(f'"{column}"', columns)
+
+    def test_pool_prefers_ranked_embeddings_over_missing_ones(self):
+        self.me.profile_embedding = [1.0] + [0.0] * 767
+        self.me.save()
+        self.u1.profile_embedding = [1.0] + [0.0] * 767
+        self.u1.save()
+        self.u2.profile_embedding = [0.5, 0.5] + [0.0] * 766
+        self.u2.save()
+
+        with mock.patch("api.views.ANN_CANDIDATES", 1), mock.patch("api.views.MAX_CANDIDATES", 2):
+            candidates = PotentialMatchesView()._get_candidates(self.me)
+
+        self.assertEqual([c["id"] for c in candidates], [self.u1.id, self.u2.id])
+        self.assertAlmostEqual(candidates[1]["emb"], 0.5, places=5)
+
+    def test_embedding_bits_follow_embedding_signs(self):
+        self.u1.profile_embedding = [0.5, -0.25, 0.0] + [1.0] * 765
+        self.u1.save()
+        self.u1.refresh_from_db()
+        self.assertEqual(self.u1.embedding_bits, "100" + "1" * 765)
+
+    def test_backfill_fills_missing_embedding_bits(self):
+        for user, embedding in [(self.u1, [1.0, -1.0]), (self.u2, [-1.0, 1.0])]:
+            user.profile_embedding = embedding + [0.0] * 766
+            user.save()
+        CustomUser.objects.update(embedding_bits=None)
+
+        out = StringIO()
+        call_command("backfill_embedding_bits", batch_size=1, stdout=out)
+
+        self.assertIn("Filled embedding_bits for 2 profiles", out.getvalue())
+        bits = dict(CustomUser.objects.filter(embedding_bits__isnull=False).values_list("id", "embedding_bits"))
+        self.assertEqual(bits, {self.u1.id: "10" + "0" * 766, self.u2.id: "01" + "0" * 766})
+
+    def test_quantized_retrieval_reranks_shortlist_exactly(self):
+        self.me.profile_embedding = [1.0, 1.0] + [0.0] * 766
+        self.me.save()
+        for user, embedding in [(self.u1, [1.0, 0.9]), (self.u2, [-1.0, -1.0]), (self.u3, [1.0, 0.1])]:
+            user.profile_embedding = embedding + [0.0] * 766
+            user.save()
+        self.me.refresh_from_db()
+
+        view = PotentialMatchesView()
+        with self.settings(FEED_QUANTIZED_RETRIEVAL=True):
+            nearest = view._get_nearest_by_embedding(self.me, view._candidate_queryset(self.me))
+
+        self.assertEqual([c["id"] for c in nearest], [self.u1.id, self.u3.id, self.u2.id])
+        self.assertAlmostEqual(nearest[0]["emb"], 1.9, places=5)
+
+    def test_nearest_is_complete_when_filters_are_selective(self):
+        # Only one user in ten is eligible, so a filtered HNSW scan capped at ef_search rows
+        # comes back far short of ANN_CANDIDATES.
+        rng = np.random.default_rng(0)
+        embeddings = l2_normalize_rows(rng.standard_normal((1000, 768)).astype(np.float32))
+        CustomUser.objects.bulk_create([
+            CustomUser(
+                username=f"ann{i}", email=f"ann{i}@test.com", password="!", profile_embedding=embedding,
+                gender="F" if i % 10 == 0 else "O", interested_in=["M"],
+            )
+            for i, embedding in enumerate(embeddings)
+        ])
+        self.me.profile_embedding = embeddings[1]
+        self.me.save()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE api_customuser")
+            cursor.execute("SET LOCAL enable_sort = off")
+
+        view = PotentialMatchesView()
+        with mock.patch("api.views.ANN_CANDIDATES", 50), mock.patch("api.views.HNSW_EF_SEARCH", 50):
+            nearest = view._get_nearest_by_embedding(self.me, view._candidate_queryset(self.me))
+
+        eligible = CustomUser.objects.filter(username__startswith="ann", gender="F").values_list("id", "profile_embedding")
+        exact = sorted(eligible, key=lambda row: -float(np.dot(row[1], embeddings[1])))[:50]
+        self.assertEqual({c["id"] for c in nearest}, {user_id for user_id, _ in exact})
+
+    def test_candidate_profile_change_invalidates_cached_feed(self):
+        url = reverse("potential_matches")
+        self.client.get(url)
+
+        self.u3.tags = []
+        self.u3.save()
+        res = self.client.get(url)
+
+        item = next(item for item in res.data if item["user"]["id"] == self.u3.id)
+        self.assertEqual(item["common"], 0)
+        self.assertEqual(feed_cache_stats()["misses"], 2)
+
+    def test_feed_cursor_pagination_walks_full_ranking(self):
+        url = reverse("potential_matches")
+        full = self.client.get(url)
+        expected_ids = [item["user"]["id"] for item in full.data]
+
+        walked_ids = []
+        res = self.client.get(url, {"page_size": 1})
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(res.data), 1)
+            walked_ids += [item["user"]["id"] for item in res.data]
+            cursor = res.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+            res = self.client.get(url, {"page_size": 1, "cursor": cursor})
+
+        self.assertEqual(walked_ids, expected_ids)
+        self.assertEqual(feed_cache_stats()["misses"], 1)
+
+    def test_feed_rejects_invalid_cursor(self):
+        res = self.client.get(reverse("potential_matches"), {"cursor": "not-a-cursor"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DatingProfilesTests(TestCase):
+    def test_matches_dating_profile_serializer(self):
+        users = [
+            CustomUser.objects.create_user(
+                username="plain", email="plain@test.com", password="pass12345", tags=["python"],
+            ),
+            CustomUser.objects.create_user(
+                username="full", email="full@test.com", password="pass12345", first_name="Ala",
+                last_name="Nowak", age=25, city="Warsaw", country="Poland", bio="hi",
+                occupation="Dev", profile_picture="profile_pics/ala.jpg",
+            ),
+            CustomUser.objects.create_user(
+                username="country", email="country@test.com", password="pass12345", country="Poland",
+            ),
+        ]
+        request = APIRequestFactory().get("/", HTTP_HOST="localhost")
+
+        profiles = dating_profiles(CustomUser.objects.filter(id__in=[u.id for u in users]), request)
+
+        for user in users:
+            expected = DatingProfileSerializer(user, context={"request": request}).data
+            self.assertEqual(profiles[user.id], expected)
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+
+        if self.server.fail:
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        embeddings = [[float(len(text)), 1.0] + [0.0] * 766 for text in body["input"]]
+        payload = json.dumps({"model": body["model"], "embeddings": embeddings}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_ollama(test_case):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+    server.requests = []
+    server.fail = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test_case.addCleanup(server.server_close)
+    test_case.addCleanup(server.shutdown)
+
+    patcher = mock.patch("api.utils_embeddings.OLLAMA_URL", f"http://127.0.0.1:{server.server_port}/api/embed")
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    return server
+
+
+class EmbeddingJobTests(TestCase):
+    def setUp(self):
+        self.server = start_fake_ollama(self)
+
+        self.users = [
+            CustomUser.objects.create_user(
+                username=f"e{i}", email=f"e{i}@test.com", password="pass12345", bio="x" * (i + 1)
+            )
+            for i in range(3)
+        ]
+
+    def test_enqueue_coalesces_pending_jobs(self):
+        enqueue_profile_embedding(self.users[0].id)
+        enqueue_profile_embedding(self.users[0].id)
+        self.assertEqual(EmbeddingJob.objects.filter(user=self.users[0]).count(), 1)
+
+    def test_jobs_are_embedded_in_one_batched_request(self):
+        for user in self.users:
+            enqueue_profile_embedding(user.id)
+
+        self.assertEqual(process_embedding_jobs(), 3)
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(sorted(self.server.requests[0]["input"]), ["x", "xx", "xxx"])
+        self.assertFalse(EmbeddingJob.objects.exists())
+        for user in self.users:
+            user.refresh_from_db()
+            self.assertIsNotNone(user.profile_embedding)
+            self.assertAlmostEqual(float(sum(x * x for x in user.profile_embedding)), 1.0, places=5)
+            self.assertEqual(user.embedding_bits, "11" + "0" * 766)
+
+    def test_failed_request_is_retried_later(self):
+        self.server.fail = True
+        enqueue_profile_embedding(self.users[0].id)
+
+        self.assertEqual(process_embedding_jobs(), 1)
+
+        job = EmbeddingJob.objects.get(user=self.users[0])
+        self.assertEqual(job.status, EmbeddingJob.Status.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(process_embedding_jobs(), 0)
+
+    def test_identical_texts_are_embedded_once(self):
+        self.users[1].bio = "  x \n"
+        self.users[1].save()
+        for user in self.users[:2]:
+            enqueue_profile_embedding(user.id)
+
+        process_embedding_jobs()
+
+        self.assertEqual(self.server.requests[0]["input"], ["x"])
+        self.users[0].refresh_from_db()
+        self.users[1].refresh_from_db()
+        self.assertEqual(list(self.users[0].profile_embedding), list(self.users[1].profile_embedding))
+
+    def test_load_embeddings_matches_orm_values(self):
+        for user in self.users:
+            enqueue_profile_embedding(user.id)
+        process_embedding_jobs()
+        self.users[2].profile_embedding = None
+        self.users[2].save()
+
+        ids, matrix = load_embeddings(CustomUser.objects.filter(id__in=[u.id for u in self.users]))
+
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertEqual(matrix.shape, (2, 768))
+        expected = dict(CustomUser.objects.filter(id__in=ids).values_list("id", "profile_embedding"))
+        for user_id, row in zip(ids, matrix):
+            self.assertEqual(row.tolist(), expected[user_id].tolist())
+
+    def test_array_helpers_match_scalar_versions(self):
+        matrix = np.array([[3.0, 4.0], [0.0, 0.0], [1.0, -1.0]])
+        vec = [0.5, 2.0]
+
+        normalized = l2_normalize_rows(matrix)
+        for row, original in zip(normalized, matrix):
+            self.assertEqual(row.tolist(), l2_normalize(original.tolist()))
+        self.assertEqual(dot_rows(matrix, vec).tolist(), [dot(row, vec) for row in matrix.tolist()])
+
+    def test_cached_text_skips_ollama(self):
+        get_profile_embeddings(["hello world"])
+        get_profile_embeddings(["hello   world"])
+
+        self.assertEqual(len(self.server.requests), 1)
+        stats = embedding_cache_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertAlmostEqual(stats["hit_rate"], 0.5)
+
+    def test_cache_hits_are_counted_per_text(self):
+        get_profile_embeddings(["a"])
+        get_profile_embeddings(["a", "a", "b", "b", "b"])
+
+        self.assertEqual(self.server.requests[1]["input"], ["b"])
+        stats = embedding_cache_stats()
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["hits"], 4)
+
+
+class ReembedProfilesCommandTests(TransactionTestCase):
+    def setUp(self):
+        self.server = start_fake_ollama(self)
+        self.users = [
+            CustomUser.objects.create_user(
+                username=f"r{i}", email=f"r{i}@test.com", password="pass12345", bio=f"bio {i}"
+            )
+            for i in range(5)
+        ]
+
+    def test_reembeds_only_profiles_from_other_models(self):
+        CustomUser.objects.filter(id=self.users[0].id).update(embedding_model=EMBED_MODEL)
+
+        call_command("reembed_profiles", batch_size=2, workers=2, stdout=StringIO())
+
+        inputs = sorted(text for request in self.server.requests for text in request["input"])
+        self.assertEqual(inputs, ["bio 1", "bio 2", "bio 3", "bio 4"])
+        self.assertFalse(CustomUser.objects.exclude(embedding_model=EMBED_MODEL).exists())
+        self.assertEqual(CustomUser.objects.filter(profile_embedding__isnull=False).count(), 4)
+
+    def test_profile_edited_during_run_keeps_its_newer_embedding(self):
+        newer = [0.0, 1.0] + [0.0] * 766
+
+        def embed_then_edit(users):
+            embed_profiles(users)
+            # Meanwhile the user edits their bio and the worker stores its embedding.
+            CustomUser.objects.filter(id=self.users[1].id).update(
+                bio="edited", profile_embedding=newer, embedding_model=EMBED_MODEL
+            )
+
+        with mock.patch("api.management.commands.reembed_profiles.embed_profiles", embed_then_edit):
+            call_command("reembed_profiles", workers=1, stdout=StringIO())
+
+        edited = CustomUser.objects.get(id=self.users[1].id)
+        self.assertEqual(edited.profile_embedding.tolist(), newer)
+        self.assertEqual(CustomUser.objects.filter(profile_embedding__isnull=False).count(), 5)
+
+    def test_batch_is_written_with_one_conditional_update(self):
+        users = list(CustomUser.objects.filter(id__in=[u.id for u in self.users]).only("id", "bio"))
+        embed_profiles(users)
+        CustomUser.objects.filter(id=users[0].id).update(bio="edited")
+
+        with self.assertNumQueries(1):
+            written = ReembedCommand()._write_embeddings(users)
+
+        self.assertEqual(sorted(written), sorted(u.id for u in users[1:]))
+        self.assertIsNone(CustomUser.objects.get(id=users[0].id).profile_embedding)
+
+    def test_rerun_after_completion_is_a_no_op(self):
+        call_command("reembed_profiles", stdout=StringIO())
+        self.server.requests.clear()
+
+        call_command("reembed_profiles", stdout=StringIO())
+        self.assertEqual(self.server.requests, [])
+
+
+class SwipeViewTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username="alice", email="alice@test.com", password="pass12345")
+        self.bob = CustomUser.objects.create_user(username="bob", email="bob@test.com", password="pass12345")
+
+    def _swipe(self, actor, target_id, action="LIKE"):
+        self.client.force_authenticate(actor)
+        return self.client.post(reverse("swipe"), {"target_id": target_id, "action": action}, format="json")
+
+    def test_mutual_like_creates_one_match(self):
+        self.assertFalse(self._swipe(self.alice, self.bob.id).data["is_match"])
+        self.assertTrue(self._swipe(self.bob, self.alice.id).data["is_match"])
+        self.assertTrue(self._swipe(self.alice, self.bob.id).data["is_match"])
+
+        match = Match.objects.get()
+        self.assertEqual((match.user_low_id, match.user_high_id), Match.ordered_pair(self.alice.id, self.bob.id))
+        self.assertEqual({user.id for user in match.users.all()}, {self.alice.id, self.bob.id})
+
+    def test_swipe_is_updated_in_place(self):
+        self._swipe(self.alice, self.bob.id, "LIKE")
+        self._swipe(self.alice, self.bob.id, "PASS")
+
+        self.assertEqual(Swipe.objects.get(actor=self.alice, target=self.bob).action, "PASS")
+        self.assertFalse(self._swipe(self.bob, self.alice.id).data["is_match"])
+
+    def test_unknown_target_is_not_found(self):
+        response = self._swipe(self.alice, self.bob.id + 1000)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Swipe.objects.exists())
+
+
+class BulkSwipeViewTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.me = CustomUser.objects.create_user(username="me", email="me@test.com", password="pass12345")
+        self.others = [
+            CustomUser.objects.create_user(username=f"o{i}", email=f"o{i}@test.com", password="pass12345")
+            for i in range(4)
+        ]
+        self.client.force_authenticate(self.me)
+
+    def test_applies_swipes_and_reports_each_item(self):
+        a, b, c, d = self.others
+        Swipe.objects.create(actor=a, target=self.me, action="LIKE")
+        Swipe.objects.create(actor=b, target=self.me, action="LIKE")
+
+        response = self.client.post(reverse("bulk_swipe"), {"swipes": [
+            {"target_id": a.id, "action": "LIKE"},
+            {"target_id": b.id, "action": "PASS"},
+            {"target_id": c.id, "action": "LIKE"},
+            {"target_id": d.id + 1000, "action": "LIKE"},
+            {"target_id": self.me.id, "action": "LIKE"},
+            {"target_id": d.id, "action": "MAYBE"},
+        ]}, format="json")
+
+        results = response.data["results"]
+        self.assertEqual([r["status"] for r in results], ["ok", "ok", "ok", "not_found", "invalid", "invalid"])
+        self.assertEqual([r["is_match"] for r in results[:3]], [True, False, False])
+        self.assertEqual(Swipe.objects.filter(actor=self.me).count(), 3)
+        self.assertEqual(Match.objects.get().user_high_id, max(self.me.id, a.id))
+
+    def test_later_swipe_on_same_target_wins(self):
+        a = self.others[0]
+        self.client.post(reverse("bulk_swipe"), [
+            {"target_id": a.id, "action": "LIKE"},
+            {"target_id": a.id, "action": "PASS"},
+        ], format="json")
+
+        self.assertEqual(Swipe.objects.get(actor=self.me, target=a).action, "PASS")
+
+    def test_cached_feeds_of_targets_are_updated_in_one_round_trip(self):
+        a, b, c, _ = self.others
+        for target in (a, b):
+            get_feed_page(target.id, lambda: [{"id": self.me.id, "priority": 0, "score": 0.0, "liked_me": False}], None, 10)
+
+        with mock.patch("api.utils_feed_cache.cache", wraps=cache) as wrapped:
+            self.client.post(reverse("bulk_swipe"), [
+                {"target_id": a.id, "action": "LIKE"},
+                {"target_id": b.id, "action": "PASS"},
+                {"target_id": c.id, "action": "LIKE"},
+            ], format="json")
+
+        self.assertEqual(wrapped.get_many.call_count, 1)
+        self.assertEqual(wrapped.set_many.call_count, 1)
+        self.assertEqual(set(wrapped.set_many.call_args.args[0]), {f"feed:{a.id}", f"feed:{b.id}"})
+        liked = {target.id: get_feed_page(target.id, list, None, 10)[0][0]["liked_me"] for target in (a, b)}
+        self.assertEqual(liked, {a.id: True, b.id: False})
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        for other in self.others:
+            Swipe.objects.create(actor=other, target=self.me, action="LIKE")
+
+        def count(targets):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post(reverse("bulk_swipe"), [
+                    {"target_id": user.id, "action": "LIKE"} for user in targets
+                ], format="json")
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count(self.others[:1]), count(self.others[1:]))
+        self.assertEqual(Match.objects.count(), 4)
+
+
+class ConcurrentSwipeTests(TransactionTestCase):
+    def test_simultaneous_mutual_likes_create_exactly_one_match(self):
+        alice = CustomUser.objects.create_user(username="alice", email="alice@test.com", password="pass12345")
+        bob = CustomUser.objects.create_user(username="bob", email="bob@test.com", password="pass12345")
+        barrier = threading.Barrier(2)
+        results = []
+
+        def swipe(actor, target):
+            client = APIClient()
+            client.force_authenticate(actor)
+            barrier.wait()
+            try:
+                response = client.post(reverse("swipe"), {"target_id": target.id, "action": "LIKE"}, format="json")
+                results.append(response.data["is_match"])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=swipe, args=pair) for pair in ((alice, bob), (bob, alice))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False, True])
+        self.assertEqual(Match.objects.count(), 1)
+
+
+class MyMatchesViewTests(APITestCase):
+    def setUp(self):
+        self.me = CustomUser.objects.create_user(username="me", email="me@test.com", password="pass12345")
+        self.client.force_authenticate(self.me)
+
+    def _add_match(self, i, messages=1):
+        partner = CustomUser.objects.create_user(
+            username=f"p{i}", email=f"p{i}@test.com", password="pass12345", first_name=f"Partner {i}"
+        )
+        low, high = Match.ordered_pair(self.me.id, partner.id)
+        match = Match.objects.create(user_low_id=low, user_high_id=high)
+        match.users.add(self.me, partner)
+        for n in range(messages):
+            Message.objects.create(match=match, sender=partner, text=f"msg {i}.{n}")
+        return match
+
+    def _count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("my_matches"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response.data
+
+    def test_query_count_does_not_grow_with_matches(self):
+        self._add_match(0)
+        few, _ = self._count_queries()
+
+        for i in range(1, 20):
+            self._add_match(i, messages=3)
+        many, data = self._count_queries()
+
+        self.assertEqual(len(data), 20)
+        self.assertEqual(few, many)
+
+    def test_partner_and_last_message(self):
+        self._add_match(1, messages=2)
+        quiet = CustomUser.objects.create_user(username="quiet", email="quiet@test.com", password="pass12345")
+        Match.objects.create(user_low=self.me, user_high=quiet).users.add(self.me, quiet)
+
+        _, data = self._count_queries()
+        by_name = {item["name"]: item for item in data}
+
+        self.assertEqual(by_name["Partner 1"]["message"], "msg 1.1")
+        self.assertTrue(by_name["Partner 1"]["time"].endswith("ago"))
+        self.assertEqual(by_name["quiet"]["message"], "New Match!")
+        self.assertEqual(by_name["quiet"]["time"], "")
+        self.assertIsNone(by_name["quiet"]["avatar"])
+
+    def test_match_summary_follows_newest_message(self):
+        match = self._add_match(1, messages=2)
+        match.refresh_from_db()
+        newest = Message.objects.filter(match=match).order_by("-id").first()
+
+        self.assertEqual(match.last_message_id, newest.id)
+        self.assertEqual(match.last_message_at, newest.timestamp)
+        self.assertEqual(match.last_message_preview, "msg 1.1")
+
+    def test_older_message_does_not_overwrite_summary(self):
+        match = self._add_match(1, messages=2)
+        older = Message.objects.filter(match=match).order_by("id").first()
+
+        update_match_summary(Message, older, created=True)
+        match.refresh_from_db()
+        self.assertEqual(match.last_message_preview, "msg 1.1")
+
+    def test_lists_matches_from_either_side_of_the_pair(self):
+        match = self._add_match(1)
+        self.client.force_authenticate(match.user_high)
+
+        _, data = self._count_queries()
+        self.assertEqual([item["match_id"] for item in data], [match.id])
+        self.assertEqual(data[0]["name"], "me")
+
+    def test_keyless_duplicates_are_merged_into_the_listed_match(self):
+        match = self._add_match(1)
+        duplicate = Match.objects.create()
+        duplicate.users.add(self.me, match.user_high)
+        Message.objects.create(match=duplicate, sender=self.me, text="hello in duplicate")
+        orphan = Match.objects.create()
+        orphan.users.add(self.me, self._add_match(2).user_high)
+        Match.objects.filter(user_high=orphan.users.exclude(id=self.me.id).get()).delete()
+
+        merge = importlib.import_module("api.migrations.0024_merge_duplicate_matches").merge_duplicate_matches
+        merge(django_apps, None)
+
+        self.assertFalse(Match.objects.filter(id=duplicate.id).exists())
+        self.assertEqual(Message.objects.filter(match=match).count(), 2)
+        _, data = self._count_queries()
+        by_id = {item["match_id"]: item for item in data}
+        self.assertEqual(by_id[match.id]["message"], "hello in duplicate")
+        self.assertIn(orphan.id, by_id)
+
+    def test_matches_are_sorted_by_recent_activity(self):
+        quiet = self._add_match(1, messages=0)
+        first = self._add_match(2)
+        second = self._add_match(3)
+        Message.objects.create(match=first, sender=self.me, text="bump")
+
+        _, data = self._count_queries()
+        self.assertEqual([item["match_id"] for item in data], [first.id, second.id, quiet.id])
+
+
+class MessageListViewTests(APITestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", email="alice@test.com", password="pass12345")
+        self.bob = CustomUser.objects.create_user(username="bob", email="bob@test.com", password="pass12345")
+        self.match = Match.objects.create()
+        self.match.users.add(self.alice, self.bob)
+        self.messages = [
+            Message.objects.create(match=self.match, sender=self.bob, text=f"msg {i}") for i in range(5)
+        ]
+        self.url = reverse("match_messages", args=[self.match.id])
+        self.client.force_authenticate(self.alice)
+
+    def _ids(self, response):
+        return [item["id"] for item in response.data]
+
+    def test_latest_page_in_chronological_order(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"page_size": 2})
+
+        self.assertEqual(self._ids(response), [m.id for m in self.messages[3:]])
+        self.assertEqual(response["X-Has-More"], "true")
+
+    def test_before_and_after_cursors(self):
+        before = self.client.get(self.url, {"before": self.messages[3].id, "page_size": 2})
+        self.assertEqual(self._ids(before), [m.id for m in self.messages[1:3]])
+        self.assertEqual(before["X-Has-More"], "true")
+
+        after = self.client.get(self.url, {"after": self.messages[2].id, "page_size": 5})
+        self.assertEqual(self._ids(after), [m.id for m in self.messages[3:]])
+        self.assertEqual(after["X-Has-More"], "false")
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {"before": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_non_member_sees_nothing_and_cannot_post(self):
+        carol = CustomUser.objects.create_user(username="carol", email="carol@test.com", password="pass12345")
+        self.client.force_authenticate(carol)
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.post(self.url, {"content": "hi"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_unknown_match_is_not_found(self):
+        response = self.client.get(reverse("match_messages", args=[self.match.id + 1000]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_member_with_empty_history_gets_an_empty_page(self):
+        Message.objects.filter(match=self.match).delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+
+class ChatBroadcasterTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", email="alice@test.com", password="pass12345")
+        self.bob = CustomUser.objects.create_user(username="bob", email="bob@test.com", password="pass12345")
+        self.carol = CustomUser.objects.create_user(username="carol", email="carol@test.com", password="pass12345")
+        self.match = Match.objects.create()
+        self.match.users.add(self.alice, self.bob)
+
+        self.broadcaster = ChatBroadcaster()
+        self.broadcaster.mark_position()
+
+    def test_message_is_delivered_only_to_other_participants(self):
+        alice_events = self.broadcaster.subscribe(self.alice.id)
+        bob_events = self.broadcaster.subscribe(self.bob.id)
+        carol_events = self.broadcaster.subscribe(self.carol.id)
+
+        msg = Message.objects.create(match=self.match, sender=self.alice, text="hi")
+        self.broadcaster.dispatch_pending()
+
+        payload = json.loads(bob_events.get_nowait())
+        self.assertEqual(payload["id"], msg.id)
+        self.assertEqual(payload["match_id"], self.match.id)
+        self.assertEqual(payload["type"], "incoming")
+        self.assertTrue(alice_events.empty())
+        self.assertTrue(carol_events.empty())
+
+    def test_dispatch_query_count_does_not_grow_with_subscribers(self):
+        for _ in range(20):
+            self.broadcaster.subscribe(self.bob.id)
+
+        Message.objects.create(match=self.match, sender=self.alice, text="one")
+        Message.objects.create(match=self.match, sender=self.alice, text="two")
+
+        with self.assertNumQueries(2):
+            self.broadcaster.dispatch_pending()
+
+    def test_notification_payload_addresses_other_participants(self):
+        msg = Message.objects.create(match=self.match, sender=self.alice, text="hi")
+        payload = json.loads(chat_notification_payload(msg))
+
+        self.assertEqual(payload["message_id"], msg.id)
+        self.assertEqual(payload["match_id"], self.match.id)
+        self.assertEqual(payload["recipient_ids"], [self.bob.id])
+
+    def test_message_notification_is_sent_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Message.objects.create(match=self.match, sender=self.alice, text="hi")
+        self.assertEqual(len(callbacks), 1)
+
+    def test_notification_for_other_users_costs_no_query(self):
+        self.broadcaster.subscribe(self.carol.id)
+        msg = Message.objects.create(match=self.match, sender=self.alice, text="hi")
+        payload = chat_notification_payload(msg)
+
+        with self.assertNumQueries(0):
+            self.broadcaster.handle_notifications([payload])
+
+    def test_addressed_notifications_are_fetched_in_one_query(self):
+        events = self.broadcaster.subscribe(self.bob.id)
+        payloads = [
+            chat_notification_payload(Message.objects.create(match=self.match, sender=self.alice, text=text))
+            for text in ("one", "two")
+        ]
+
+        with self.assertNumQueries(1):
+            self.broadcaster.handle_notifications(payloads)
+
+        contents = [json.loads(events.get_nowait())["content"] for _ in range(2)]
+        self.assertEqual(contents, ["one", "two"])
+
+    def test_bare_notification_falls_back_to_scanning(self):
+        events = self.broadcaster.subscribe(self.bob.id)
+        Message.objects.create(match=self.match, sender=self.alice, text="hi")
+
+        self.broadcaster.handle_notifications([""])
+        self.assertEqual(json.loads(events.get_nowait())["content"], "hi")
+
+    def test_unsubscribed_stream_receives_nothing(self):
+        events = self.broadcaster.subscribe(self.bob.id)
+        self.broadcaster.unsubscribe(self.bob.id, events)
+
+        Message.objects.create(match=self.match, sender=self.alice, text="hi")
+        self.broadcaster.dispatch_pending()
+        self.assertTrue(events.empty())
+
+
+class AsyncChatBroadcasterTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username="alice", email="alice@test.com", password="pass12345")
+        self.bob = CustomUser.objects.create_user(username="bob", email="bob@test.com", password="pass12345")
+        self.match = Match.objects.create()
+        self.match.users.add(self.alice, self.bob)
+        self.broadcaster = AsyncChatBroadcaster()
+
+    async def test_addressed_notification_is_delivered(self):
+        await self.broadcaster.mark_position()
+        events = self.broadcaster.subscribe(self.bob.id)
+        msg = await Message.objects.acreate(match=self.match, sender=self.alice, text="hi")
+        payload = await sync_to_async(chat_notification_payload)(msg)
+
+        await self.broadcaster.handle_notifications([payload])
+
+        data = json.loads(events.get_nowait())
+        self.assertEqual(data["id"], msg.id)
+        self.assertEqual(data["match_id"], self.match.id)
+
+    async def test_bare_notification_falls_back_to_scanning(self):
+        await self.broadcaster.mark_position()
+        events = self.broadcaster.subscribe(self.bob.id)
+        await Message.objects.acreate(match=self.match, sender=self.alice, text="hi")
+
+        await self.broadcaster.handle_notifications([""])
+        self.assertEqual(json.loads(events.get_nowait())["content"], "hi")
+
+    async def test_async_stream_requires_token(self):
+        response = await self.async_client.get(reverse("async_chat_stream"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_async_stream_auth_closes_stale_connections(self):
+        with mock.patch("api.views.close_old_connections") as close:
+            response = await self.async_client.get(
+                reverse("async_chat_stream"), headers={"Authorization": "Bearer broken"}
+            )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(close.call_count, 2)
+
+    async def test_listener_connects_with_database_options(self):
+        options = {**connection.settings_dict["OPTIONS"], "sslmode": "prefer"}
+        with (
+            mock.patch.dict(connection.settings_dict, {"OPTIONS": options}),
+            mock.patch("psycopg.AsyncConnection.connect", side_effect=ConnectionError) as connect,
+        ):
+            with self.assertRaises(ConnectionError):
+                await self.broadcaster._listen()
+        params = connect.call_args.kwargs
+        self.assertEqual(params["sslmode"], "prefer")
+        self.assertEqual(params["dbname"], connection.settings_dict["NAME"])
+        self.assertNotIn("cursor_factory", params)
@@ -7,10 +7,12 @@ from .views import (
     UserProfileView,
     PotentialMatchesView,
     SwipeView,
+    BulkSwipeView,
     MyMatchesView,
     MessageListView,
     CustomTokenObtainPairView,
-    GlobalChatStreamView
+    GlobalChatStreamView,
+    AsyncChatStreamView
 )
 
 urlpatterns = [
@@ -22,10 +24,12 @@ urlpatterns = [
 
     path('dating/feed/', PotentialMatchesView.as_view(), name='potential_matches'),
     path('dating/swipe/', SwipeView.as_view(), name='swipe'),
+    path('dating/swipe/bulk/', BulkSwipeView.as_view(), name='bulk_swipe'),
     path('dating/matches/', MyMatchesView.as_view(), name='my_matches'),
 
     path('chat/<int:match_id>/messages/', MessageListView.as_view(), name='match_messages'),
     path('chat/stream/', GlobalChatStreamView.as_view(), name='global_chat_stream'),
+    path('chat/stream/async/', AsyncChatStreamView.as_view(), name='async_chat_stream'),
 ]
 
 if settings.DEBUG:
@@ -1,5 +1,9 @@
-﻿from math import radians, cos, sin, asin, sqrt
+﻿from math import radians, degrees, cos, sin, asin, sqrt
 import requests
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371
 
 def reverse_geocode_city(lat: float, lon: float):
     url = "https://nominatim.openstreetmap.org/reverse"
@@ -35,4 +39,34 @@ def distance_km(lat1, lon1, lat2, lon2):
     a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
     a = min(1.0, max(0.0, a))  # clamp
     c = 2 * asin(sqrt(a))
-    return 6371 * c
\ No newline at end of file
+    return EARTH_RADIUS_KM * c
+
+def bounding_box(lat, lon, radius_km):
+    """Lat/lon box enclosing the circle; longitude bounds are None near the poles or the antimeridian."""
+    angular = radius_km / EARTH_RADIUS_KM
+    dlat = degrees(angular)
+    min_lat, max_lat = lat - dlat, lat + dlat
+
+    if min_lat <= -90 or max_lat >= 90:
+        return min_lat, max_lat, None, None
+
+    # widest longitude of the circle, reached at its tangent points rather than on `lat`
+    dlon = degrees(asin(sin(angular) / cos(radians(lat))))
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if min_lon < -180 or max_lon > 180:
+        return min_lat, max_lat, None, None
+
+    return min_lat, max_lat, min_lon, max_lon
+
+def distance_km_expression(lat, lon, lat_field="latitude", lon_field="longitude"):
+    """Haversine distance from (lat, lon) to the row's coordinates, evaluated in SQL."""
+    lat1 = Radians(Value(lat, output_field=FloatField()))
+    lon1 = Radians(Value(lon, output_field=FloatField()))
+    lat2 = Radians(F(lat_field))
+    lon2 = Radians(F(lon_field))
+
+    a = (
+        Power(Sin((lat2 - lat1) / 2), 2) +
+        Cos(lat1) * Cos(lat2) * Power(Sin((lon2 - lon1) / 2), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(Least(Value(1.0), a)))
\ No newline at end of file
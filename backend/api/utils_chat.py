@@ -0,0 +1,266 @@
+import asyncio
+import contextvars
+import json
+import logging
+import queue
+import threading
+import time
+import psycopg
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connections
+from django.db.models import Prefetch
+
+from .models import DB_NOTIFY_CHANNEL, CustomUser, Message
+from .serializers import MessageSerializer
+
+logger = logging.getLogger(__name__)
+
+LISTEN_TIMEOUT = 15
+RECONNECT_DELAY = 5
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def _parse_notifications(payloads: list[str]) -> list[dict] | None:
+    """Decoded notification payloads, or None if any of them is a bare NOTIFY from an older sender."""
+    try:
+        return [json.loads(payload) for payload in payloads]
+    except ValueError:
+        return None
+
+def _addressed_messages(events: list[dict], subscribers: dict) -> dict[int, list[int]]:
+    """Message id -> recipient ids, for the messages at least one open stream is waiting for."""
+    return {
+        event['message_id']: event['recipient_ids']
+        for event in events
+        if any(user_id in subscribers for user_id in event['recipient_ids'])
+    }
+
+def _match_recipients(msg) -> list[int]:
+    return [user.id for user in msg.match.users.all() if user.id != msg.sender_id]
+
+def _event_payload(msg) -> str:
+    # No request in the context: every recipient sees the message as incoming.
+    data = MessageSerializer(msg).data
+    data['match_id'] = msg.match_id
+    return json.dumps(data)
+
+def _pending_messages(last_id: int):
+    return (
+        Message.objects.filter(id__gt=last_id)
+        .select_related("sender", "match")
+        .defer("sender__profile_embedding")
+        .prefetch_related(Prefetch("match__users", queryset=CustomUser.objects.only("id")))
+        .order_by("id")
+    )
+
+def _addressed_queryset(addressed: dict):
+    return Message.objects.filter(id__in=addressed).select_related("sender").defer("sender__profile_embedding").order_by("id")
+
+
+class ChatBroadcaster:
+    """Holds the process's single LISTEN connection and fans new messages out to SSE subscribers.
+
+    Notifications carry the message and recipient ids, so one not addressed to any open stream
+    costs no query at all; the rest cost one query per batch, however many streams are open.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: dict[int, set[queue.Queue]] = {}
+        self._thread = None
+        self._last_id = None
+
+    def ensure_listening(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen_forever, name="chat-listener", daemon=True)
+                self._thread.start()
+
+    def subscribe(self, user_id: int) -> queue.Queue:
+        events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(events)
+        return events
+
+    def unsubscribe(self, user_id: int, events: queue.Queue) -> None:
+        with self._lock:
+            streams = self._subscribers.get(user_id)
+            if streams is not None:
+                streams.discard(events)
+                if not streams:
+                    del self._subscribers[user_id]
+
+    def mark_position(self) -> None:
+        """Only messages created after this call are dispatched."""
+        last_msg = Message.objects.order_by('-id').only('id').first()
+        self._last_id = last_msg.id if last_msg else 0
+
+    def dispatch_pending(self) -> None:
+        """Delivers every message newer than the last dispatched one to its recipients' streams."""
+        for msg in _pending_messages(self._last_id):
+            self._last_id = msg.id
+            self._publish(_match_recipients(msg), msg)
+
+    def handle_notifications(self, payloads: list[str]) -> None:
+        events = _parse_notifications(payloads)
+        if events is None:
+            # A bare NOTIFY (older sender): fall back to scanning for new messages.
+            self.dispatch_pending()
+            return
+
+        with self._lock:
+            addressed = _addressed_messages(events, self._subscribers)
+        if events:
+            self._last_id = max([self._last_id or 0] + [event['message_id'] for event in events])
+        if not addressed:
+            return
+
+        for msg in _addressed_queryset(addressed):
+            self._publish(addressed[msg.id], msg)
+
+    def _publish(self, recipients, msg) -> None:
+        with self._lock:
+            streams = [events for user_id in recipients for events in self._subscribers.get(user_id, ())]
+        if not streams:
+            return
+
+        payload = _event_payload(msg)
+        for events in streams:
+            try:
+                events.put_nowait(payload)
+            except queue.Full:
+                # A stalled client loses live events; it still gets them from the messages endpoint.
+                logger.warning("Dropping chat event for a slow subscriber")
+
+    def _listen_forever(self) -> None:
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Chat listener failed, reconnecting in %ss", RECONNECT_DELAY)
+                time.sleep(RECONNECT_DELAY)
+
+    def _listen(self) -> None:
+        # A dedicated connection: Django's per-thread connection keeps serving the ORM queries.
+        listener = connections.create_connection('default')
+        listener.ensure_connection()
+        listener.set_autocommit(True)
+        try:
+            raw = listener.connection
+            raw.execute(f"LISTEN {DB_NOTIFY_CHANNEL}")
+
+            close_old_connections()
+            if self._last_id is None:
+                self.mark_position()
+            else:
+                # Catch up on whatever was sent while the listener was disconnected.
+                self.dispatch_pending()
+
+            while True:
+                payloads = [notify.payload for notify in raw.notifies(timeout=LISTEN_TIMEOUT, stop_after=1)]
+                if payloads:
+                    close_old_connections()
+                    self.handle_notifications(payloads)
+        finally:
+            listener.close()
+
+
+class AsyncChatBroadcaster:
+    """The ASGI counterpart of ChatBroadcaster: one async LISTEN connection per event loop.
+
+    Streams are asyncio queues and the listener is a task on the same loop, so an idle
+    stream costs a queue and a suspended coroutine instead of a worker thread.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._task = None
+        self._last_id = None
+
+    def ensure_listening(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            # A fresh context, so the listener's ORM calls don't run on the first request's thread.
+            self._task = loop.create_task(
+                self._listen_forever(), name="chat-listener", context=contextvars.Context()
+            )
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        events = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(events)
+        return events
+
+    def unsubscribe(self, user_id: int, events: asyncio.Queue) -> None:
+        streams = self._subscribers.get(user_id)
+        if streams is not None:
+            streams.discard(events)
+            if not streams:
+                del self._subscribers[user_id]
+
+    async def mark_position(self) -> None:
+        last_msg = await Message.objects.order_by('-id').only('id').afirst()
+        self._last_id = last_msg.id if last_msg else 0
+
+    async def dispatch_pending(self) -> None:
+        async for msg in _pending_messages(self._last_id):
+            self._last_id = msg.id
+            self._publish(_match_recipients(msg), msg)
+
+    async def handle_notifications(self, payloads: list[str]) -> None:
+        events = _parse_notifications(payloads)
+        if events is None:
+            await self.dispatch_pending()
+            return
+
+        addressed = _addressed_messages(events, self._subscribers)
+        if events:
+            self._last_id = max([self._last_id or 0] + [event['message_id'] for event in events])
+        if not addressed:
+            return
+
+        async for msg in _addressed_queryset(addressed):
+            self._publish(addressed[msg.id], msg)
+
+    def _publish(self, recipients, msg) -> None:
+        streams = [events for user_id in recipients for events in self._subscribers.get(user_id, ())]
+        if not streams:
+            return
+
+        payload = _event_payload(msg)
+        for events in streams:
+            try:
+                events.put_nowait(payload)
+            except asyncio.QueueFull:
+                logger.warning("Dropping chat event for a slow subscriber")
+
+    async def _listen_forever(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except Exception:
+                logger.exception("Chat listener failed, reconnecting in %ss", RECONNECT_DELAY)
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _listen(self) -> None:
+        # Django's own connection parameters, OPTIONS (sslmode, ...) included; the sync cursor
+        # class and adapters it adds don't apply to an async LISTEN connection.
+        params = connections['default'].get_connection_params()
+        params.pop('cursor_factory', None)
+        params.pop('context', None)
+        conn = await psycopg.AsyncConnection.connect(autocommit=True, **params)
+        async with conn:
+            await conn.execute(f"LISTEN {DB_NOTIFY_CHANNEL}")
+
+            await sync_to_async(close_old_connections)()
+            if self._last_id is None:
+                await self.mark_position()
+            else:
+                await self.dispatch_pending()
+
+            async for notify in conn.notifies():
+                await sync_to_async(close_old_connections)()
+                await self.handle_notifications([notify.payload])
+
+
+chat_broadcaster = ChatBroadcaster()
+async_chat_broadcaster = AsyncChatBroadcaster()
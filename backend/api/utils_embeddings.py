@@ -1,10 +1,21 @@
-﻿import requests, math
+﻿import requests, math, os, hashlib, unicodedata
 from collections.abc import Sequence
-import threading
-from django.db import close_old_connections
+from datetime import timedelta
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import BinaryField, Func
 
-OLLAMA_URL = "http://localhost:11434/api/embed"
+from .models import CustomUser, EmbeddingCache, EmbeddingCacheStats, EmbeddingJob, embedding_sign_bits
+from .tasks import refresh_enrichment_status
+from .utils_feed_cache import invalidate_profile
+from .utils_tasks import claim_rows, retry_rows
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/embed")
 EMBED_MODEL = "nomic-embed-text"
+EMBED_BATCH_SIZE = 32
+EMBED_MAX_ATTEMPTS = 5
+EMBED_RETRY_BACKOFF = timedelta(seconds=10)
+EMBED_JOB_LEASE = timedelta(minutes=5)
 
 
 def l2_normalize(vec: Sequence[float]) -> list[float]:
@@ -16,45 +27,169 @@ def l2_normalize(vec: Sequence[float]) -> list[float]:
 def dot(a: Sequence[float], b: Sequence[float]) -> float:
     return sum(x * y for x, y in zip(a, b))
 
-def refresh_profile_embedding_async(user_id: int) -> None:
-    def _job():
-        close_old_connections()
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        user = User.objects.get(pk=user_id)
-        refresh_profile_embedding(user)
+def l2_normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """l2_normalize() for every row of a 2-D array; zero rows are left as they are."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.array(matrix, copy=True), where=norms > 0)
 
+def dot_rows(matrix: np.ndarray, vec: Sequence[float]) -> np.ndarray:
+    """dot() of every row of `matrix` with `vec`."""
+    return matrix @ np.asarray(vec, dtype=matrix.dtype)
 
-    t = threading.Thread(target=_job, daemon=True)
-    t.start()
 
-def refresh_profile_embedding(user):
-    text = build_profile_text(user)
-    if not text:
-        user.profile_embedding = None
-        user.save(update_fields=["profile_embedding"])
-        return
+class VectorSend(Func):
+    """pgvector's binary wire format: int16 dimensions, int16 unused, then big-endian float32s."""
+    function = "vector_send"
+    output_field = BinaryField()
+
+_VECTOR_HEADER = 4
 
-    user.profile_embedding = l2_normalize(get_embedding(text))
-    user.save(update_fields=["profile_embedding"])
+def load_embeddings(queryset, field: str = "profile_embedding", key: str = "pk") -> tuple[list, np.ndarray]:
+    """(keys, float32 matrix with one row per key) for the rows of `queryset` that have `field`.
+
+    Vectors are fetched in binary and decoded from one contiguous buffer, instead of parsing
+    768 decimal strings per row.
+    """
+    rows = (
+        queryset.filter(**{f"{field}__isnull": False})
+        .annotate(vector_bytes=VectorSend(field))
+        .values_list(key, "vector_bytes")
+    )
+    keys, matrix = [], None
+    for i, (k, vector) in enumerate(rows):
+        if matrix is None:
+            matrix = np.empty((len(rows), (len(vector) - _VECTOR_HEADER) // 4), dtype=np.float32)
+        keys.append(k)
+        matrix[i] = np.frombuffer(vector, dtype=">f4", offset=_VECTOR_HEADER)
+    if matrix is None:
+        return [], np.empty((0, 0), dtype=np.float32)
+    return keys, matrix
+
+def enqueue_profile_embedding(user_id: int) -> None:
+    """Queues (or re-queues) the user's embedding; repeated saves collapse into one pending job."""
+    EmbeddingJob.objects.bulk_create(
+        [EmbeddingJob(user_id=user_id)],
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["status", "attempts", "last_error", "run_after", "claimed_at"],
+    )
+
+def process_embedding_jobs(limit: int = EMBED_BATCH_SIZE) -> int:
+    """Embeds one batch of queued profiles with a single Ollama request. Returns the number of jobs claimed."""
+    jobs = claim_rows(EmbeddingJob, limit, EMBED_JOB_LEASE)
+    if not jobs:
+        return 0
+
+    users = CustomUser.objects.only("id", "bio").in_bulk([job.user_id for job in jobs])
+
+    try:
+        embed_profiles(list(users.values()))
+    except (requests.RequestException, KeyError, ValueError) as exc:
+        given_up = retry_rows(EmbeddingJob, jobs, exc, EMBED_MAX_ATTEMPTS, EMBED_RETRY_BACKOFF)
+        refresh_enrichment_status([job.user_id for job in given_up])
+        return len(jobs)
+
+    with transaction.atomic():
+        CustomUser.objects.bulk_update(users.values(), ["profile_embedding", "embedding_bits", "embedding_model"])
+        # A job re-queued while we were embedding has claimed_at reset and survives for the next run.
+        EmbeddingJob.objects.filter(
+            id__in=[job.id for job in jobs],
+            status=EmbeddingJob.Status.RUNNING,
+            claimed_at=jobs[0].claimed_at,
+        ).delete()
+
+    # bulk_update skips post_save, so the feed cache is told directly.
+    for user_id in users:
+        invalidate_profile(user_id)
+    refresh_enrichment_status(users)
+    return len(jobs)
+
+def embed_profiles(users) -> None:
+    """Sets profile_embedding (with embedding_bits) and embedding_model on `users` in place, with at
+    most one Ollama request."""
+    texts = [build_profile_text(user) for user in users]
+    to_embed = [i for i, text in enumerate(texts) if text]
+    vectors = get_profile_embeddings([texts[i] for i in to_embed]) if to_embed else []
+    embeddings = dict(zip(to_embed, vectors))
+
+    for i, user in enumerate(users):
+        user.profile_embedding = embeddings.get(i)
+        user.embedding_bits = embedding_sign_bits(user.profile_embedding)
+        user.embedding_model = EMBED_MODEL
 
 def build_profile_text(user: "CustomUser") -> str:
     return (user.bio or "").strip()
 
 
-def get_embedding(text: str) -> list[float]:
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def text_hash(text: str) -> str:
+    """Cache key of a profile text: the embedding model plus the normalized text."""
+    return hashlib.sha256(f"{EMBED_MODEL}\0{normalize_text(text)}".encode()).hexdigest()
+
+def get_profile_embeddings(texts: list[str]) -> list[np.ndarray]:
+    """L2-normalized embeddings for `texts`; only texts never embedded with EMBED_MODEL reach Ollama."""
+    hashes = [text_hash(text) for text in texts]
+    vectors = dict(zip(*load_embeddings(
+        EmbeddingCache.objects.filter(text_hash__in=set(hashes)), "embedding", key="text_hash"
+    )))
+
+    missing = {}
+    for key, text in zip(hashes, texts):
+        if key not in vectors:
+            missing.setdefault(key, normalize_text(text))
+
+    if missing:
+        embedded = np.asarray(get_embeddings(list(missing.values())), dtype=np.float32)
+        fresh = dict(zip(missing, l2_normalize_rows(embedded)))
+        EmbeddingCache.objects.bulk_create(
+            [EmbeddingCache(text_hash=key, model=EMBED_MODEL, embedding=vec) for key, vec in fresh.items()],
+            ignore_conflicts=True,
+        )
+        vectors.update(fresh)
+
+    # Per text: each distinct missing text is one miss, every other text (including repeats
+    # of a missing one) was served without asking Ollama.
+    _count_lookups(hits=len(texts) - len(missing), misses=len(missing))
+    return [vectors[key] for key in hashes]
+
+def _count_lookups(hits: int, misses: int) -> None:
+    """Adds to the single counters row, once per call rather than once per cached text."""
+    if not hits and not misses:
+        return
+    table = EmbeddingCacheStats._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (id, hits, misses) VALUES (1, %s, %s)
+            ON CONFLICT (id) DO UPDATE SET hits = {table}.hits + EXCLUDED.hits, misses = {table}.misses + EXCLUDED.misses
+            """,
+            [hits, misses],
+        )
+
+def embedding_cache_stats() -> dict:
+    stats = EmbeddingCacheStats.objects.filter(id=1).values("hits", "misses").first() or {"hits": 0, "misses": 0}
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        "hits": stats["hits"],
+        "misses": stats["misses"],
+        "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+    }
+
+
+def get_embeddings(texts: list[str]) -> list[list[float]]:
     r = requests.post(
         OLLAMA_URL,
-        json={"model": EMBED_MODEL, "input": [text]},
+        json={"model": EMBED_MODEL, "input": texts},
         timeout=30,
     )
     r.raise_for_status()
     data = r.json()
 
     if "embeddings" in data:
-        return data["embeddings"][0]
+        if len(data["embeddings"]) != len(texts):
+            raise ValueError(f"Ollama returned {len(data['embeddings'])} embeddings for {len(texts)} texts")
+        return data["embeddings"]
 
     raise KeyError(f"Unexpected Ollama response keys: {list(data.keys())}")
-
-
-
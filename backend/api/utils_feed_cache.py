@@ -0,0 +1,146 @@
+import base64
+import bisect
+import json
+import time
+from django.core.cache import cache
+
+from .utils_scoring import MATCH_THRESHOLD
+
+FEED_CACHE_TTL = 15 * 60
+HITS_KEY = "feed:stats:hits"
+MISSES_KEY = "feed:stats:misses"
+
+
+def _feed_key(user_id: int) -> str:
+    return f"feed:{user_id}"
+
+def _profile_changed_key(user_id: int) -> str:
+    return f"feed:profile_changed:{user_id}"
+
+
+def _order_key(entry: dict) -> tuple:
+    return -entry["priority"], -entry["score"], entry["id"]
+
+def sort_entries(entries: list[dict]) -> list[dict]:
+    return sorted(entries, key=_order_key)
+
+
+def encode_cursor(entry: dict) -> str:
+    raw = json.dumps([entry["priority"], entry["score"], entry["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """Sort key of the entry a cursor points at; raises ValueError on anything malformed."""
+    try:
+        priority, score, candidate_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return -int(priority), -float(score), int(candidate_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def get_feed_page(user_id: int, compute, after: tuple | None, page_size: int) -> tuple[list[dict], bool, bool]:
+    """One page of ranked feed entries (id + scores) following the `after` cursor key.
+
+    The ranked list is recomputed only on a miss, which includes a cached feed whose
+    requested page holds a candidate that changed their profile after it was computed, and
+    one swiped down to an empty or short page: the ranking was capped, so more candidates
+    may be waiting behind it.
+    Returns the page, whether more entries follow it, and whether it came from the cache.
+    """
+    feed = cache.get(_feed_key(user_id))
+    if feed is not None:
+        page, has_more = _slice_page(feed["entries"], after, page_size)
+        if not _is_exhausted(feed, page, page_size) and _page_is_fresh(feed, page):
+            _count(HITS_KEY)
+            return page, has_more, True
+
+    _count(MISSES_KEY)
+    computed_at = time.time()
+    entries = sort_entries(compute())
+    cache.set(
+        _feed_key(user_id),
+        {"computed_at": computed_at, "size": len(entries), "entries": entries},
+        FEED_CACHE_TTL,
+    )
+    return *_slice_page(entries, after, page_size), False
+
+def _slice_page(entries: list[dict], after: tuple | None, page_size: int) -> tuple[list[dict], bool]:
+    start = bisect.bisect_right(entries, after, key=_order_key) if after is not None else 0
+    return entries[start:start + page_size], start + page_size < len(entries)
+
+def _is_exhausted(feed: dict, page: list[dict], page_size: int) -> bool:
+    # A short page of a ranking nobody was removed from is just the end of the feed.
+    swiped = len(feed["entries"]) < feed.get("size", len(feed["entries"]))
+    return not page or (len(page) < page_size and swiped)
+
+def _page_is_fresh(feed: dict, page: list[dict]) -> bool:
+    keys = [_profile_changed_key(entry["id"]) for entry in page]
+    changed_at = cache.get_many(keys).values()
+    return all(ts < feed["computed_at"] for ts in changed_at)
+
+
+def remove_candidate(user_id: int, candidate_id: int) -> None:
+    remove_candidates(user_id, [candidate_id])
+
+def remove_candidates(user_id: int, candidate_ids) -> None:
+    candidate_ids = set(candidate_ids)
+    feed = cache.get(_feed_key(user_id)) if candidate_ids else None
+    if feed is None:
+        return
+
+    feed["entries"] = [entry for entry in feed["entries"] if entry["id"] not in candidate_ids]
+    cache.set(_feed_key(user_id), feed, _remaining_ttl(feed))
+
+def set_liked_me(user_id: int, candidate_id: int, liked: bool) -> None:
+    """Updates the liked_me flag (and match priority) of one entry in the user's cached feed."""
+    set_liked_me_in_feeds(candidate_id, {user_id: liked})
+
+def set_liked_me_in_feeds(candidate_id: int, liked_by: dict[int, bool]) -> None:
+    """set_liked_me() for `candidate_id`'s entry in each given user's feed: one cache read, and
+    one write for the feeds that are cached and hold the entry."""
+    feeds = cache.get_many([_feed_key(user_id) for user_id in liked_by])
+    changed = {}
+    for user_id, liked in liked_by.items():
+        feed = feeds.get(_feed_key(user_id))
+        if feed is None:
+            continue
+        for entry in feed["entries"]:
+            if entry["id"] == candidate_id:
+                entry["liked_me"] = liked
+                entry["priority"] = 1 if (liked and entry["score"] >= MATCH_THRESHOLD) else 0
+                feed["entries"] = sort_entries(feed["entries"])
+                changed[_feed_key(user_id)] = feed
+                break
+
+    if changed:
+        # One timeout for the batch: the soonest expiry, so no feed outlives its own.
+        cache.set_many(changed, min(_remaining_ttl(feed) for feed in changed.values()))
+
+
+def _remaining_ttl(feed: dict) -> float:
+    # Updates keep the feed's original expiry; swiping must not keep an old ranking alive.
+    return max(feed["computed_at"] + FEED_CACHE_TTL - time.time(), 1)
+
+def invalidate_profile(user_id: int) -> None:
+    """Drops the user's own feed and marks their entry stale in everybody else's."""
+    cache.delete(_feed_key(user_id))
+    cache.set(_profile_changed_key(user_id), time.time(), FEED_CACHE_TTL)
+
+
+def _count(key: str) -> None:
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+def feed_cache_stats() -> dict:
+    """Counters as seen by this process: with a per-process cache backend that is only its own."""
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total else 0.0,
+    }
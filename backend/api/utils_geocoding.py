@@ -0,0 +1,185 @@
+import csv
+import logging
+import math
+import os
+import threading
+from collections import defaultdict
+from functools import lru_cache
+import numpy as np
+import requests
+from django.conf import settings
+
+from .models import GeocodeCache
+from .utils import EARTH_RADIUS_KM, distance_km, reverse_geocode_city
+
+logger = logging.getLogger(__name__)
+
+GRID_CELL_DEG = 1.0
+MAX_CITY_DISTANCE_KM = 50
+# Lookups are cached per 0.01-degree cell (about 1 km); smaller moves keep the current city.
+GEOCODE_CELL_DEG = 0.01
+GEOCODE_LRU_SIZE = 10_000
+GEOCODE_MOVE_THRESHOLD_KM = 1.0
+
+# GeoNames dump columns (cities*.txt, countryInfo.txt)
+_NAME, _LAT, _LON, _COUNTRY_CODE = 1, 4, 5, 8
+_INFO_ISO, _INFO_NAME = 0, 4
+
+
+class CityIndex:
+    """Nearest-city lookup over a 1-degree grid: a query only looks at the cities in its own and
+    neighbouring cells, so it stays in the microsecond range whatever the size of the dataset.
+    """
+
+    def __init__(self, names, countries, lats, lons):
+        self.names = names
+        self.countries = countries
+        self.lats = np.radians(np.asarray(lats, dtype=np.float64))
+        self.lons = np.radians(np.asarray(lons, dtype=np.float64))
+
+        cells = defaultdict(list)
+        for i, (lat, lon) in enumerate(zip(lats, lons)):
+            cells[self._cell(lat, lon)].append(i)
+        self.cells = {cell: np.asarray(ids) for cell, ids in cells.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_geonames(cls, cities_path, country_info_path=None):
+        country_names = _load_country_names(country_info_path) if country_info_path else {}
+        names, countries, lats, lons = [], [], [], []
+        with open(cities_path, encoding="utf-8", newline="") as f:
+            for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                names.append(row[_NAME])
+                countries.append(country_names.get(row[_COUNTRY_CODE], row[_COUNTRY_CODE]))
+                lats.append(float(row[_LAT]))
+                lons.append(float(row[_LON]))
+        return cls(names, countries, lats, lons)
+
+    @staticmethod
+    def _cell(lat, lon):
+        return math.floor(lat / GRID_CELL_DEG), math.floor(lon / GRID_CELL_DEG)
+
+    def nearest(self, lat: float, lon: float, max_distance_km: float = MAX_CITY_DISTANCE_KM):
+        """(city, country) of the closest city within `max_distance_km`, or None."""
+        cell_lat, cell_lon = self._cell(lat, lon)
+        # Enough neighbouring columns to cover max_distance_km, which widen towards the poles.
+        rows = math.ceil(max_distance_km / (111.0 * GRID_CELL_DEG))
+        columns = round(360 / GRID_CELL_DEG)
+        cols = min(math.ceil(rows / max(math.cos(math.radians(lat)), 1e-6)), columns // 2)
+
+        candidates = [
+            self.cells[cell]
+            for dlat in range(-rows, rows + 1)
+            for dlon in range(-cols, cols + 1)
+            if (cell := (cell_lat + dlat, (cell_lon + dlon + columns // 2) % columns - columns // 2)) in self.cells
+        ]
+        if not candidates:
+            return None
+        ids = np.concatenate(candidates)
+
+        lat1, lon1 = math.radians(lat), math.radians(lon)
+        a = (
+            np.sin((self.lats[ids] - lat1) / 2) ** 2
+            + math.cos(lat1) * np.cos(self.lats[ids]) * np.sin((self.lons[ids] - lon1) / 2) ** 2
+        )
+        best = int(np.argmin(a))
+        distance = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, float(a[best]))))
+        if distance > max_distance_km:
+            return None
+        return self.names[ids[best]], self.countries[ids[best]]
+
+
+def _load_country_names(path):
+    names = {}
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if row and not row[0].startswith("#"):
+                names[row[_INFO_ISO]] = row[_INFO_NAME]
+    return names
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_city_index():
+    """The process-wide index, loaded on first use; None if no dataset is configured."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                country_info = settings.GEONAMES_COUNTRY_INFO_FILE
+                try:
+                    _index = CityIndex.from_geonames(
+                        settings.GEONAMES_CITIES_FILE, country_info if os.path.isfile(country_info) else None
+                    )
+                except OSError as exc:
+                    logger.warning("Offline reverse geocoding disabled: %s", exc)
+                    _index = CityIndex([], [], [], [])
+    return _index if len(_index) else None
+
+
+class GeocodeUnavailable(Exception):
+    pass
+
+def reverse_geocode(lat: float, lon: float, strict: bool = False) -> tuple[str, str]:
+    """(city, country) for the coordinates; ("", "") when nothing is known about them.
+
+    With `strict`, a failed remote lookup, or having no lookup source configured at all,
+    raises GeocodeUnavailable instead.
+    """
+    try:
+        return _geocode_cell(round(lat / GEOCODE_CELL_DEG), round(lon / GEOCODE_CELL_DEG))
+    except GeocodeUnavailable:
+        if strict:
+            raise
+        return "", ""
+
+@lru_cache(maxsize=GEOCODE_LRU_SIZE)
+def _geocode_cell(lat_cell: int, lon_cell: int) -> tuple[str, str]:
+    lat, lon = lat_cell * GEOCODE_CELL_DEG, lon_cell * GEOCODE_CELL_DEG
+    index = get_city_index()
+    if index is not None:
+        found = index.nearest(lat, lon)
+        if found is not None:
+            return found
+
+    if not settings.GEOCODE_REMOTE_FALLBACK:
+        if index is None:
+            # No source at all says nothing about the place; callers must keep what they have.
+            raise GeocodeUnavailable("No GeoNames dataset and GEOCODE_REMOTE_FALLBACK is off")
+        return "", ""
+
+    # Remote answers are kept across restarts; the local index is cheaper than a lookup.
+    cached = GeocodeCache.objects.filter(lat_cell=lat_cell, lon_cell=lon_cell).values_list("city", "country").first()
+    if cached is not None:
+        return cached
+
+    try:
+        city, country = reverse_geocode_city(lat, lon)
+    except requests.RequestException:
+        # Raised rather than returned, so lru_cache doesn't remember the failure.
+        logger.exception("Remote reverse geocoding failed")
+        raise GeocodeUnavailable
+
+    GeocodeCache.objects.bulk_create(
+        [GeocodeCache(lat_cell=lat_cell, lon_cell=lon_cell, city=city[:100], country=country[:100])],
+        ignore_conflicts=True,
+    )
+    return city, country
+
+
+def location_moved(old_lat, old_lon, new_lat, new_lon) -> bool:
+    if new_lat is None or new_lon is None:
+        return False
+    if old_lat is None or old_lon is None:
+        return True
+    return distance_km(old_lat, old_lon, new_lat, new_lon) > GEOCODE_MOVE_THRESHOLD_KM
+
+def geocoded_location(lat, lon, strict: bool = False) -> dict:
+    """{"city", "country"} to save for the coordinates, or {} if they are incomplete."""
+    if lat is None or lon is None:
+        return {}
+    city, country = reverse_geocode(lat, lon, strict)
+    return {"city": city, "country": country}
@@ -0,0 +1,47 @@
+from collections.abc import Iterable
+from django.db import connection
+
+from .models import Match, Swipe
+
+
+def lock_pairs(user_id: int, other_ids: Iterable[int]) -> None:
+    """Serializes swipes within each pair until the transaction ends, so two simultaneous
+    mutual likes can't both miss each other. Keys are taken in sorted order to avoid deadlocks.
+    """
+    keys = sorted({"match:{}:{}".format(*Match.ordered_pair(user_id, other_id)) for other_id in other_ids})
+    if not keys:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(hashtextextended(key, 0)) "
+            "FROM (SELECT key FROM unnest(%s::text[]) AS key ORDER BY key) AS pairs",
+            [keys],
+        )
+
+def mutual_likes(user_id: int, liked_ids: Iterable[int]) -> set[int]:
+    """The subset of `liked_ids` that liked `user_id` back."""
+    return set(
+        Swipe.objects.filter(actor_id__in=list(liked_ids), target_id=user_id, action=Swipe.Action.LIKE)
+        .values_list("actor_id", flat=True)
+    )
+
+def create_matches(user_id: int, other_ids: Iterable[int]) -> None:
+    """Creates the user's matches with `other_ids`; existing pairs are re-activated, never duplicated."""
+    pairs = [Match.ordered_pair(user_id, other_id) for other_id in dict.fromkeys(other_ids)]
+    if not pairs:
+        return
+
+    matches = Match.objects.bulk_create(
+        [Match(user_low_id=low, user_high_id=high) for low, high in pairs],
+        update_conflicts=True,
+        unique_fields=["user_low", "user_high"],
+        update_fields=["is_active"],
+    )
+    Match.users.through.objects.bulk_create(
+        [
+            Match.users.through(match_id=match.id, customuser_id=member_id)
+            for match, pair in zip(matches, pairs)
+            for member_id in pair
+        ],
+        ignore_conflicts=True,
+    )
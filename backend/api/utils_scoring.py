@@ -0,0 +1,47 @@
+import numpy as np
+
+WEIGHT_TAGS = 0.1
+WEIGHT_COSINE = 0.4
+WEIGHT_EMBEDDING = 0.5
+MATCH_THRESHOLD = 0.6
+
+
+def tag_incidence(tag_ids_per_candidate) -> tuple[np.ndarray, np.ndarray]:
+    """Sparse (row, tag id) coordinates of the candidate x tag incidence matrix."""
+    lengths = np.fromiter((len(ids or ()) for ids in tag_ids_per_candidate), dtype=np.intp)
+    rows = np.repeat(np.arange(len(lengths), dtype=np.intp), lengths)
+    cols = np.fromiter(
+        (tag_id for ids in tag_ids_per_candidate for tag_id in ids or ()), dtype=np.intp, count=int(lengths.sum())
+    )
+    return rows, cols
+
+
+def score_candidates(user_tag_ids, candidate_tag_ids, emb_scores) -> dict[str, np.ndarray]:
+    """Scores a whole candidate pool in one pass, from distinct interned tag ids (Tag.intern).
+
+    Produces the same numbers as `cosine(build_tag_vector(...))` per candidate: with binary
+    tag vectors the dot product is the common-tag count and each norm is sqrt(distinct tags).
+    """
+    n = len(candidate_tag_ids)
+    user_ids = np.asarray(user_tag_ids or [], dtype=np.intp)
+    rows, cols = tag_incidence(candidate_tag_ids)
+
+    # The user's tags as a bitmap over the global tag ids: membership is a single lookup.
+    user_mask = np.zeros(max(user_ids.max(initial=-1), cols.max(initial=-1)) + 1, dtype=bool)
+    user_mask[user_ids] = True
+
+    common = np.bincount(rows[user_mask[cols]], minlength=n).astype(np.int64)
+    tag_counts = np.bincount(rows, minlength=n)
+
+    norms = np.sqrt(len(user_ids)) * np.sqrt(tag_counts)
+    cosine = np.divide(common, norms, out=np.zeros(n), where=norms > 0)
+
+    emb = np.asarray(emb_scores, dtype=np.float64)
+    final = WEIGHT_TAGS * common + WEIGHT_COSINE * cosine + WEIGHT_EMBEDDING * emb
+
+    return {
+        "final": final,
+        "common": common,
+        "cosine": cosine,
+        "emb": emb,
+    }
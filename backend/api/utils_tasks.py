@@ -0,0 +1,126 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+TASK_BATCH_SIZE = 20
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_BACKOFF = timedelta(seconds=10)
+TASK_LEASE = timedelta(minutes=5)
+
+_handlers = {}
+
+
+def task(name: str, on_failure=None):
+    """Registers a function as the handler of background tasks called `name`.
+
+    `on_failure` is called with the same arguments once a task has used up its attempts.
+    """
+    def register(func):
+        _handlers[name] = (func, on_failure)
+        return func
+    return register
+
+def enqueue_task(name: str, **kwargs) -> None:
+    """Queues a task in the caller's transaction: workers only see it once that commits,
+    and it is never lost to a crash between the commit and the enqueue."""
+    if name not in _handlers:
+        raise ValueError(f"Unknown background task: {name}")
+    BackgroundTask.objects.create(name=name, kwargs=kwargs)
+
+def claim_rows(model, limit: int, lease: timedelta) -> list:
+    """Marks up to `limit` due rows of a queue model (BackgroundTask, EmbeddingJob) as running;
+    rows of a crashed worker are reclaimed after the lease."""
+    now = timezone.now()
+    due = model.objects.select_for_update(skip_locked=True).filter(
+        Q(status=model.Status.PENDING, run_after__lte=now) |
+        Q(status=model.Status.RUNNING, claimed_at__lt=now - lease)
+    )
+
+    with transaction.atomic():
+        rows = list(due.order_by("run_after")[:limit])
+        model.objects.filter(id__in=[row.id for row in rows]).update(status=model.Status.RUNNING, claimed_at=now)
+
+    for row in rows:
+        row.status = model.Status.RUNNING
+        row.claimed_at = now
+    return rows
+
+def retry_rows(model, rows: list, exc: Exception, max_attempts: int, backoff: timedelta) -> list:
+    """Puts claimed rows back with an exponential backoff, or marks them failed after
+    `max_attempts`. Returns the rows that were given up on."""
+    now = timezone.now()
+    given_up = []
+    for row in rows:
+        attempts = row.attempts + 1
+        failed = attempts >= max_attempts
+        if failed:
+            given_up.append(row)
+        # Only while still ours: a row re-queued meanwhile keeps its fresh state.
+        model.objects.filter(id=row.id, status=model.Status.RUNNING, claimed_at=row.claimed_at).update(
+            status=model.Status.FAILED if failed else model.Status.PENDING,
+            attempts=attempts,
+            last_error=str(exc),
+            run_after=now + backoff * 2 ** (attempts - 1),
+            claimed_at=None,
+        )
+    return given_up
+
+def run_tasks(limit: int = TASK_BATCH_SIZE) -> int:
+    """Runs one batch of due tasks. Returns the number of tasks claimed."""
+    tasks = claim_rows(BackgroundTask, limit, TASK_LEASE)
+    for t in tasks:
+        handler, _ = _handlers.get(t.name, (None, None))
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for {t.name}")
+            # The row goes away with the handler's writes, so handlers can tell they were the last one.
+            with transaction.atomic():
+                BackgroundTask.objects.filter(id=t.id).delete()
+                handler(**t.kwargs)
+        except Exception as exc:
+            logger.exception("Background task %s failed", t.name)
+            _retry_task(t, exc)
+    return len(tasks)
+
+def _retry_task(t: BackgroundTask, exc: Exception) -> None:
+    if retry_rows(BackgroundTask, [t], exc, TASK_MAX_ATTEMPTS, TASK_RETRY_BACKOFF):
+        _, on_failure = _handlers.get(t.name, (None, None))
+        if on_failure is not None:
+            on_failure(**t.kwargs)
+
+def run_workers(batch, workers: int, poll_interval: float, once: bool = False) -> int:
+    """Calls `batch()` (which returns how many items it claimed) from `workers` threads until
+    interrupted, sleeping `poll_interval` whenever a call finds nothing to do; with `once`,
+    until then. Returns the total claimed."""
+    stop = threading.Event()
+
+    def work():
+        processed = 0
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                claimed = batch()
+                processed += claimed
+                if claimed == 0:
+                    if once:
+                        break
+                    stop.wait(poll_interval)
+        finally:
+            connection.close()
+        return processed
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(work) for _ in range(workers)]
+        try:
+            return sum(future.result() for future in futures)
+        except KeyboardInterrupt:
+            stop.set()
+            return sum(future.result() for future in futures)
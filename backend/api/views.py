@@ -1,12 +1,20 @@
-import json
-import select
-from django.db import transaction, connection
-from django.http import StreamingHttpResponse
+import asyncio
+import queue
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction, connection
+from django.db.models import Exists, ExpressionWrapper, F, FloatField, Func, OuterRef, Prefetch, Q, Value
+from django.db.models.functions import Cast
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views import View
 from rest_framework import generics, permissions, status, views
+from rest_framework.exceptions import AuthenticationFailed, NotFound, ParseError, PermissionDenied
 from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.views import TokenObtainPairView
+from pgvector.django import BitField, MaxInnerProduct
 
 from .models import CustomUser, Match, Message, Swipe
 from .serializers import (
@@ -17,17 +25,38 @@ from .serializers import (
     SwipeActionSerializer,
     UserRegistrationSerializer,
     UserSerializer,
+    dating_profiles,
 )
-from .utils import build_tag_vector, cosine, distance_km, reverse_geocode_city
-from .utils_embeddings import dot, refresh_profile_embedding_async
+from .tasks import queue_geocoding
+from .utils import bounding_box, distance_km_expression
+from .utils_chat import async_chat_broadcaster, chat_broadcaster
+from .utils_embeddings import enqueue_profile_embedding
+from .utils_feed_cache import (
+    decode_cursor,
+    encode_cursor,
+    get_feed_page,
+    remove_candidate,
+    remove_candidates,
+    set_liked_me,
+    set_liked_me_in_feeds,
+)
+from .utils_geocoding import location_moved
+from .utils_matches import create_matches, lock_pairs, mutual_likes
+from .utils_scoring import MATCH_THRESHOLD, score_candidates
 
-WEIGHT_TAGS = 0.1
-WEIGHT_COSINE = 0.4
-WEIGHT_EMBEDDING = 0.5
-MATCH_THRESHOLD = 0.6
 MAX_CANDIDATES = 5000
+# All ranking needs per candidate; the rest of the profile is loaded for the returned page only.
+CANDIDATE_FIELDS = ("id", "tag_ids", "emb")
+ANN_CANDIDATES = 1000
+# Quantized retrieval re-ranks this many times ANN_CANDIDATES exactly.
+QUANTIZED_OVERSAMPLING = 4
+HNSW_EF_SEARCH = 1000
 TOP_RESULTS = 50
-DB_NOTIFY_CHANNEL = "chat_updates"
+MAX_FEED_PAGE_SIZE = 100
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 100
+MAX_BULK_SWIPES = 500
+KEEP_ALIVE_INTERVAL = 15
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
@@ -39,14 +68,12 @@ class RegisterView(generics.CreateAPIView):
     parser_classes = (MultiPartParser, FormParser, JSONParser)
 
     def perform_create(self, serializer):
-        user = serializer.save()
-        self._update_location(user)
-        transaction.on_commit(lambda: refresh_profile_embedding_async(user.id))
-
-    def _update_location(self, user):
-        if user.latitude is not None and user.longitude is not None:
-            user.city, user.country = reverse_geocode_city(user.latitude, user.longitude)
-            user.save(update_fields=["city", "country"])
+        # Location and embedding are filled in by the workers; the response doesn't wait for them.
+        with transaction.atomic():
+            user = serializer.save(enrichment_status=CustomUser.Enrichment.PENDING)
+            if user.latitude is not None and user.longitude is not None:
+                queue_geocoding(user.id, user.latitude, user.longitude)
+            enqueue_profile_embedding(user.id)
 
 class UserProfileView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
@@ -57,18 +84,23 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
         return self.request.user
 
     def perform_update(self, serializer):
-        initial_bio = serializer.instance.bio
-        user = serializer.save()
-
-        self._update_location_if_needed(user)
-
-        if "description" in serializer.validated_data and user.bio != initial_bio:
-            transaction.on_commit(lambda: refresh_profile_embedding_async(user.id))
+        instance = serializer.instance
+        data = serializer.validated_data
+        lat = data.get("latitude", instance.latitude)
+        lon = data.get("longitude", instance.longitude)
+        # Also retried on any save while the user has no city yet, e.g. after a failed lookup.
+        geocode = location_moved(instance.latitude, instance.longitude, lat, lon) or (
+            lat is not None and lon is not None and not instance.city
+        )
+        bio_changed = "bio" in data and data["bio"] != instance.bio
 
-    def _update_location_if_needed(self, user):
-        if user.latitude and user.longitude:
-            user.city, user.country = reverse_geocode_city(user.latitude, user.longitude)
-            user.save(update_fields=["city", "country"])
+        extra = {"enrichment_status": CustomUser.Enrichment.PENDING} if geocode or bio_changed else {}
+        with transaction.atomic():
+            user = serializer.save(**extra)
+            if geocode:
+                queue_geocoding(user.id, lat, lon)
+            if bio_changed:
+                enqueue_profile_embedding(user.id)
 
 class PotentialMatchesView(generics.ListAPIView):
     serializer_class = DatingProfileSerializer
@@ -76,55 +108,165 @@ class PotentialMatchesView(generics.ListAPIView):
 
     def list(self, request, *args, **kwargs):
         current_user = request.user
-        candidates = self._get_candidates(current_user)
-        candidates = self._filter_by_distance(current_user, candidates)
-        candidates = self._filter_by_age(current_user, candidates)
+        page, has_more, cached = get_feed_page(
+            current_user.id,
+            lambda: self._score_candidates(current_user, self._get_candidates(current_user)),
+            self._get_cursor(request),
+            self._get_page_size(request),
+        )
 
-        scored_candidates = self._score_candidates(current_user, candidates)
+        response = Response(self._serialize_page(page))
+        response["X-Feed-Cache"] = "hit" if cached else "miss"
+        if has_more and page:
+            response["X-Next-Cursor"] = encode_cursor(page[-1])
+        return response
 
-        sorted_candidates = sorted(
-            scored_candidates,
-            key=lambda item: (item["priority"], item["score"]),
-            reverse=True
+    def _get_cursor(self, request):
+        cursor = request.query_params.get("cursor")
+        if not cursor:
+            return None
+        try:
+            return decode_cursor(cursor)
+        except ValueError:
+            raise ParseError("Invalid cursor")
+
+    def _get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get("page_size", TOP_RESULTS))
+        except ValueError:
+            return TOP_RESULTS
+        return min(max(page_size, 1), MAX_FEED_PAGE_SIZE)
+
+    def _serialize_page(self, entries):
+        profiles = dating_profiles(
+            CustomUser.objects.filter(id__in=[entry["id"] for entry in entries]), self.request
         )
 
-        return Response(sorted_candidates[:TOP_RESULTS])
+        page = []
+        for entry in entries:
+            profile = profiles.get(entry["id"])
+            if profile is None:
+                continue
+
+            item = {key: value for key, value in entry.items() if key != "id"}
+            item["user"] = profile
+            page.append(item)
+        return page
 
     def _get_candidates(self, user):
-        swiped_ids = Swipe.objects.filter(actor=user).values_list("target_id", flat=True)
-        queryset = CustomUser.objects.exclude(id__in=swiped_ids).exclude(id=user.id).exclude(role=CustomUser.Role.ADMIN)
+        queryset = self._candidate_queryset(user)
+
+        if user.profile_embedding is None:
+            return list(queryset.annotate(emb=Value(0.0)).values(*CANDIDATE_FIELDS)[:MAX_CANDIDATES])
+
+        nearest = self._get_nearest_by_embedding(user, queryset)
+        # The rest of the pool goes to the next-closest profiles before anyone without an
+        # embedding (emb 0), as when the whole pool was ranked.
+        nearest += self._rank_exactly(user, queryset, nearest, MAX_CANDIDATES - len(nearest))
+        without_embedding = queryset.filter(profile_embedding__isnull=True).annotate(emb=Value(0.0))
+
+        return nearest + list(without_embedding.values(*CANDIDATE_FIELDS)[:MAX_CANDIDATES - len(nearest)])
+
+    def _candidate_queryset(self, user):
+        """Everyone the user may be shown, before ranking."""
+        queryset = CustomUser.objects.exclude(id=user.id).exclude(role=CustomUser.Role.ADMIN)
+        queryset = self._exclude_swiped(user, queryset)
 
         if user.interested_in:
             queryset = queryset.filter(gender__in=user.interested_in)
 
-        return list(queryset.filter(interested_in__contains=[user.gender])[:MAX_CANDIDATES])
+        queryset = queryset.filter(interested_in__contains=[user.gender]).defer("profile_embedding")
+        queryset = self._filter_by_distance(user, queryset)
+        return self._filter_by_age(user, queryset)
+
+    def _get_nearest_by_embedding(self, user, queryset):
+        if settings.FEED_QUANTIZED_RETRIEVAL and user.embedding_bits:
+            return self._get_nearest_by_quantized(user, queryset)
+
+        # ORDER BY must be the bare `<#>` distance, otherwise the HNSW index is not used.
+        by_index = (
+            queryset.filter(profile_embedding__isnull=False)
+            .annotate(emb_distance=MaxInnerProduct("profile_embedding", user.profile_embedding))
+            .order_by("emb_distance")
+            .values("id", "tag_ids", "emb_distance")[:ANN_CANDIDATES]
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL hnsw.ef_search = %s", [HNSW_EF_SEARCH])
+            nearest = [
+                {"id": row["id"], "tag_ids": row["tag_ids"], "emb": -row["emb_distance"]}
+                for row in by_index
+            ]
+
+        # An index scan stops after hnsw.ef_search rows and the feed filters are applied to
+        # those, so selective filters leave it short; the rest is ranked exactly.
+        return nearest + self._rank_exactly(user, queryset, nearest, ANN_CANDIDATES - len(nearest))
+
+    def _rank_exactly(self, user, queryset, found, limit):
+        """Up to `limit` candidates with an embedding, not in `found`, closest first."""
+        if limit <= 0:
+            return []
+        distance = MaxInnerProduct("profile_embedding", user.profile_embedding)
+        # Ordering by the negated distance rather than the bare `<#>` keeps the planner off the index.
+        return list(
+            queryset.filter(profile_embedding__isnull=False)
+            .exclude(id__in=[c["id"] for c in found])
+            .annotate(emb=ExpressionWrapper(-distance, output_field=FloatField()))
+            .order_by("-emb")
+            .values(*CANDIDATE_FIELDS)[:limit]
+        )
+
+    def _get_nearest_by_quantized(self, user, queryset, oversampling=QUANTIZED_OVERSAMPLING):
+        # Hamming distance between sign bits ranks close to the inner product; scanning the
+        # 96-byte bits never detoasts the full vectors. Only the shortlist is scored exactly.
+        hamming = Func(
+            "embedding_bits", Cast(Value(user.embedding_bits), BitField(length=768)),
+            template="bit_count(%(expressions)s)", arg_joiner=" # ",
+        )
+        shortlist = (
+            queryset.filter(embedding_bits__isnull=False)
+            .annotate(hamming=hamming)
+            .order_by("hamming")
+            .values("id")[:ANN_CANDIDATES * oversampling]
+        )
+        nearest = (
+            CustomUser.objects.filter(id__in=shortlist)
+            .annotate(emb_distance=MaxInnerProduct("profile_embedding", user.profile_embedding))
+            .order_by("emb_distance")
+            .values("id", "tag_ids", "emb_distance")[:ANN_CANDIDATES]
+        )
+        return [{"id": row["id"], "tag_ids": row["tag_ids"], "emb": -row["emb_distance"]} for row in nearest]
+
+    def _exclude_swiped(self, user, queryset):
+        # NOT EXISTS plans as an anti-join probing the (actor_id, target_id) unique index;
+        # NOT IN (subquery) can't, and degrades badly once the swiped set outgrows work_mem.
+        swiped = Swipe.objects.filter(actor=user, target=OuterRef("pk"))
+        return queryset.filter(~Exists(swiped))
 
-    def _filter_by_age(self, user, candidates):
+    def _filter_by_age(self, user, queryset):
         if user.age is None:
-            return candidates
+            return queryset
 
         max_diff = getattr(user, "max_age_diff", None)
         if max_diff is None:
-            return candidates
+            return queryset
 
-        min_age = user.age - max_diff
-        max_age = user.age + max_diff
+        return queryset.filter(age__range=(user.age - max_diff, user.age + max_diff))
 
-        return [
-            c for c in candidates
-            if c.age is not None and min_age <= c.age <= max_age
-        ]
-
-    def _filter_by_distance(self, user, candidates):
+    def _filter_by_distance(self, user, queryset):
         if user.latitude is None or user.longitude is None:
-            return candidates
+            return queryset
 
         max_dist = user.max_distance
-        return [
-            c for c in candidates
-            if c.latitude and c.longitude and
-               distance_km(user.latitude, user.longitude, c.latitude, c.longitude) <= max_dist
-        ]
+        min_lat, max_lat, min_lon, max_lon = bounding_box(user.latitude, user.longitude, max_dist)
+
+        # The box is index-friendly and discards most rows before the exact distance is computed.
+        queryset = queryset.filter(latitude__range=(min_lat, max_lat), longitude__isnull=False)
+        if min_lon is not None:
+            queryset = queryset.filter(longitude__range=(min_lon, max_lon))
+
+        return queryset.alias(
+            distance=distance_km_expression(user.latitude, user.longitude)
+        ).filter(distance__lte=max_dist)
 
     def _score_candidates(self, user, candidates):
         liked_me_ids = set(
@@ -132,49 +274,35 @@ class PotentialMatchesView(generics.ListAPIView):
             .values_list("actor_id", flat=True)
         )
 
-        all_tags = (user.tags or []) + [tag for c in candidates for tag in (c.tags or [])]
-        vocab = sorted(set(all_tags))
-        user_vector = build_tag_vector(user.tags, vocab)
+        scores = score_candidates(
+            user.tag_ids,
+            [c["tag_ids"] for c in candidates],
+            [c["emb"] for c in candidates],
+        )
+        rows = zip(
+            candidates,
+            scores["final"].tolist(),
+            scores["common"].tolist(),
+            scores["cosine"].tolist(),
+            scores["emb"].tolist(),
+        )
 
         scored = []
-        for candidate in candidates:
-            score_data = self._calculate_single_score(user, user_vector, candidate, vocab)
-
-            is_liked_by_candidate = candidate.id in liked_me_ids
-            priority = 1 if (is_liked_by_candidate and score_data['final'] >= MATCH_THRESHOLD) else 0
+        for candidate, final_score, common_count, cosine_score, emb_score in rows:
+            is_liked_by_candidate = candidate["id"] in liked_me_ids
+            priority = 1 if (is_liked_by_candidate and final_score >= MATCH_THRESHOLD) else 0
 
             scored.append({
-                "score": round(score_data['final'], 4),
+                "id": candidate["id"],
+                "score": round(final_score, 4),
                 "priority": priority,
                 "liked_me": is_liked_by_candidate,
-                "common": score_data['common'],
-                "cosine": round(score_data['cosine'], 4),
-                "emb": round(score_data['emb'], 4),
-                "user": self.get_serializer(candidate).data,
+                "common": common_count,
+                "cosine": round(cosine_score, 4),
+                "emb": round(emb_score, 4),
             })
         return scored
 
-    def _calculate_single_score(self, user, user_vector, candidate, vocab):
-        common_count = len(set(user.tags or []) & set(candidate.tags or []))
-        cosine_score = cosine(user_vector, build_tag_vector(candidate.tags, vocab))
-
-        emb_score = 0.0
-        if user.profile_embedding is not None and candidate.profile_embedding is not None:
-            emb_score = dot(user.profile_embedding, candidate.profile_embedding)
-
-        final_score = (
-                WEIGHT_TAGS * common_count +
-                WEIGHT_COSINE * cosine_score +
-                WEIGHT_EMBEDDING * emb_score
-        )
-
-        return {
-            "final": final_score,
-            "common": common_count,
-            "cosine": cosine_score,
-            "emb": emb_score
-        }
-
 class SwipeView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -188,61 +316,186 @@ class SwipeView(views.APIView):
         if request.user.id == target_id:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        target = get_object_or_404(CustomUser, id=target_id)
+        with transaction.atomic():
+            if not self._record_swipe(request.user.id, target_id, action):
+                raise NotFound()
+            is_match = action == Swipe.Action.LIKE and self._match_if_mutual(request.user.id, target_id)
 
-        self._record_swipe(request.user, target, action)
-        is_match = self._check_match(request.user, target, action)
+        remove_candidate(request.user.id, target_id)
+        set_liked_me(target_id, request.user.id, action == Swipe.Action.LIKE)
 
         return Response({"is_match": is_match}, status=status.HTTP_200_OK)
 
-    def _record_swipe(self, actor, target, action):
-        Swipe.objects.update_or_create(
-            actor=actor,
-            target=target,
-            defaults={'action': action}
-        )
-
-    def _check_match(self, actor, target, action):
-        if action != Swipe.Action.LIKE:
+    def _record_swipe(self, actor_id, target_id, action):
+        """Upserts the swipe in one statement; returns False if the target user doesn't exist."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Swipe._meta.db_table} (actor_id, target_id, action, created_at)
+                SELECT %s, id, %s, now() FROM {CustomUser._meta.db_table} WHERE id = %s
+                ON CONFLICT (actor_id, target_id) DO UPDATE SET action = EXCLUDED.action
+                RETURNING id
+                """,
+                [actor_id, action, target_id],
+            )
+            return cursor.fetchone() is not None
+
+    def _match_if_mutual(self, actor_id, target_id):
+        lock_pairs(actor_id, [target_id])
+        if not mutual_likes(actor_id, [target_id]):
             return False
+        create_matches(actor_id, [target_id])
+        return True
 
-        has_liked_back = Swipe.objects.filter(
-            actor=target, target=actor, action=Swipe.Action.LIKE
-        ).exists()
+class BulkSwipeView(views.APIView):
+    """Replays a client's queued swipes: a list of {target_id, action}, applied in order.
 
-        if has_liked_back:
-            existing_match = Match.objects.filter(users=actor).filter(users=target).first()
-
-            if not existing_match:
-                match = Match.objects.create()
-                match.users.add(actor, target)
+    Returns one result per item; a later swipe on the same target overrides an earlier one.
+    """
+    permission_classes = [permissions.IsAuthenticated]
 
-            return True
+    def post(self, request):
+        items = request.data.get('swipes') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            raise ParseError("Expected a list of swipes")
+        if len(items) > MAX_BULK_SWIPES:
+            raise ParseError(f"At most {MAX_BULK_SWIPES} swipes per request")
+
+        user_id = request.user.id
+        results = []
+        actions = {}
+        for item in items:
+            serializer = SwipeActionSerializer(data=item)
+            if not serializer.is_valid():
+                results.append({'status': 'invalid', 'errors': serializer.errors})
+                continue
+            target_id = serializer.validated_data['target_id']
+            results.append({'target_id': target_id, 'action': serializer.validated_data['action']})
+            if target_id != user_id:
+                actions[target_id] = serializer.validated_data['action']
+
+        existing = set(CustomUser.objects.filter(id__in=actions).values_list('id', flat=True))
+        actions = {target_id: action for target_id, action in actions.items() if target_id in existing}
+        liked = [target_id for target_id, action in actions.items() if action == Swipe.Action.LIKE]
+
+        with transaction.atomic():
+            Swipe.objects.bulk_create(
+                [Swipe(actor_id=user_id, target_id=target_id, action=action) for target_id, action in actions.items()],
+                update_conflicts=True,
+                unique_fields=['actor', 'target'],
+                update_fields=['action'],
+            )
+            lock_pairs(user_id, liked)
+            matched = mutual_likes(user_id, liked) if liked else set()
+            create_matches(user_id, matched)
+
+        remove_candidates(user_id, actions.keys())
+        set_liked_me_in_feeds(user_id, {target_id: action == Swipe.Action.LIKE for target_id, action in actions.items()})
+
+        for result in results:
+            if 'target_id' not in result:
+                continue
+            target_id = result['target_id']
+            if target_id == user_id:
+                result['status'] = 'invalid'
+            elif target_id not in actions:
+                result['status'] = 'not_found'
+            else:
+                result['status'] = 'ok'
+                result['is_match'] = target_id in matched
 
-        return False
+        return Response({'results': results}, status=status.HTTP_200_OK)
 
 class MyMatchesView(generics.ListAPIView):
     serializer_class = MatchListSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Match.objects.filter(users=self.request.user, is_active=True).distinct()
+        user = self.request.user
+        partners = CustomUser.objects.exclude(id=user.id).only(
+            'id', 'username', 'first_name', 'occupation', 'profile_picture'
+        )
+        return (
+            # Through the pair columns rather than the users join, so both inbox indexes apply.
+            Match.objects.filter(Q(user_low=user) | Q(user_high=user), is_active=True)
+            .prefetch_related(Prefetch('users', queryset=partners, to_attr='partners'))
+            .order_by(F('last_message_at').desc(nulls_last=True), '-created_at')
+        )
 
 class MessageListView(generics.ListCreateAPIView):
+    """Chat history, newest page by default; `before`/`after` page backwards/forwards by message id."""
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        match = get_object_or_404(Match, id=self.kwargs['match_id'])
-        if self.request.user not in match.users.all():
-            return Message.objects.none()
-        return Message.objects.filter(match=match)
+        match_id = self.kwargs['match_id']
+        # Non-members get no rows from the same single query; list() tells them apart.
+        membership = Match.users.through.objects.filter(match_id=match_id, customuser_id=self.request.user.id)
+        return (
+            Message.objects.filter(Exists(membership), match_id=match_id)
+            .select_related('sender')
+            .only('id', 'text', 'timestamp', 'match_id', 'sender_id', 'sender__first_name')
+        )
+
+    def list(self, request, *args, **kwargs):
+        before = self._get_message_id(request, 'before')
+        after = self._get_message_id(request, 'after')
+        if before is not None and after is not None:
+            raise ParseError("Use either 'before' or 'after', not both")
+        page_size = self._get_page_size(request)
+
+        queryset = self.get_queryset()
+        if after is not None:
+            messages = list(queryset.filter(id__gt=after).order_by('id')[:page_size + 1])
+            has_more = len(messages) > page_size
+            messages = messages[:page_size]
+        else:
+            if before is not None:
+                queryset = queryset.filter(id__lt=before)
+            messages = list(queryset.order_by('-id')[:page_size + 1])
+            has_more = len(messages) > page_size
+            messages = messages[:page_size][::-1]
+
+        if not messages:
+            self._check_access(kwargs['match_id'])
+
+        response = Response(self.get_serializer(messages, many=True).data)
+        response['X-Has-More'] = 'true' if has_more else 'false'
+        return response
+
+    def _check_access(self, match_id):
+        # Only for an empty page: a page with messages already proved membership.
+        match = Match.objects.filter(id=match_id).annotate(
+            is_member=Exists(Match.users.through.objects.filter(match_id=match_id, customuser_id=self.request.user.id))
+        ).values('is_member').first()
+        if match is None:
+            raise NotFound()
+        if not match['is_member']:
+            raise PermissionDenied()
+
+    def _get_message_id(self, request, param):
+        value = request.query_params.get(param)
+        if not value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ParseError(f"Invalid '{param}' message id")
+
+    def _get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get("page_size", MESSAGE_PAGE_SIZE))
+        except ValueError:
+            return MESSAGE_PAGE_SIZE
+        return min(max(page_size, 1), MAX_MESSAGE_PAGE_SIZE)
 
     def perform_create(self, serializer):
         match = get_object_or_404(Match, id=self.kwargs['match_id'])
-        if self.request.user not in match.users.all():
-            raise permissions.PermissionDenied()
-        serializer.save(sender=self.request.user, match=match)
+        if not match.users.filter(id=self.request.user.id).exists():
+            raise PermissionDenied()
+        # The message and its match's inbox summary are committed together.
+        with transaction.atomic():
+            serializer.save(sender=self.request.user, match=match)
 
 class GlobalChatStreamView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -257,28 +510,66 @@ class GlobalChatStreamView(views.APIView):
         return response
 
     def _event_stream(self, request):
-        last_msg = Message.objects.order_by('-id').first()
-        last_id = last_msg.id if last_msg else 0
-        connection.ensure_connection()
+        chat_broadcaster.ensure_listening()
+        events = chat_broadcaster.subscribe(request.user.id)
+
+        try:
+            while True:
+                try:
+                    payload = events.get(timeout=KEEP_ALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {payload}\n\n"
+        finally:
+            chat_broadcaster.unsubscribe(request.user.id, events)
+
+
+def _authenticate_stream(request):
+    # Off the shared thread, so request_started/finished don't clean this thread's connection;
+    # drop broken or expired ones here the way they would for a request.
+    close_old_connections()
+    try:
+        return JWTAuthentication().authenticate(request)
+    finally:
+        close_old_connections()
+
+
+class AsyncChatStreamView(View):
+    """Same events as GlobalChatStreamView, served from the event loop; needs an ASGI server."""
+
+    async def get(self, request):
+        try:
+            # The shared pool keeps a bounded set of DB connections; a per-request thread would
+            # hold one for as long as the stream stays open.
+            auth = await sync_to_async(_authenticate_stream, thread_sensitive=False)(request)
+        except AuthenticationFailed as exc:
+            return JsonResponse({'detail': str(exc.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        if auth is None:
+            return JsonResponse(
+                {'detail': 'Authentication credentials were not provided.'},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
 
-        with connection.cursor() as cursor:
-            cursor.execute(f"LISTEN {DB_NOTIFY_CHANNEL}")
+        response = StreamingHttpResponse(
+            self._event_stream(auth[0].id),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
-        while True:
-            if select.select([connection.connection], [], [], 15) == ([], [], []):
-                yield ": keep-alive\n\n"
-            else:
-                connection.connection.poll()
-                while connection.connection.notifies:
-                    connection.connection.notifies.pop(0)
-
-                new_messages = Message.objects.filter(
-                    match__users=request.user,
-                    id__gt=last_id
-                ).exclude(sender=request.user).order_by('id')
-
-                for msg in new_messages:
-                    data = MessageSerializer(msg, context={'request': request}).data
-                    data['match_id'] = msg.match.id
-                    yield f"data: {json.dumps(data)}\n\n"
-                    last_id = msg.id
\ No newline at end of file
+    async def _event_stream(self, user_id):
+        async_chat_broadcaster.ensure_listening()
+        events = async_chat_broadcaster.subscribe(user_id)
+
+        try:
+            while True:
+                try:
+                    payload = await asyncio.wait_for(events.get(), KEEP_ALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {payload}\n\n"
+        finally:
+            async_chat_broadcaster.unsubscribe(user_id, events)
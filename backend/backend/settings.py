@@ -58,6 +58,7 @@ TEMPLATES = [
 WSGI_APPLICATION = 'backend.wsgi.application'
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor', 'X-Has-More', 'X-Feed-Cache']
 
 DATABASES = {
     'default': {
@@ -70,8 +71,33 @@ DATABASES = {
     }
 }
 
+# The local-memory default is per process: feed invalidations, swipe removals and the feed
+# cache hit/miss counters are only seen by the process that made them, so it is only safe
+# with a single server process. Otherwise use a shared cache, e.g. the redis service in
+# docker-compose: CACHE_BACKEND=django.core.cache.backends.redis.RedisCache,
+# CACHE_LOCATION=redis://localhost:6379/0
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'dating-app'),
+    }
+}
+
 AUTH_USER_MODEL = 'api.CustomUser'
 
+# Offline reverse geocoding: GeoNames cities dump (e.g. cities1000.txt) and, for country
+# names instead of ISO codes, countryInfo.txt; `manage.py fetch_geonames` downloads both.
+# Nominatim is only asked when enabled. With neither, geocoding tasks fail instead of saving
+# blank cities (check api.W001).
+GEONAMES_CITIES_FILE = os.environ.get('GEONAMES_CITIES_FILE', str(BASE_DIR / 'data' / 'cities1000.txt'))
+GEONAMES_COUNTRY_INFO_FILE = os.environ.get('GEONAMES_COUNTRY_INFO_FILE', str(BASE_DIR / 'data' / 'countryInfo.txt'))
+GEOCODE_REMOTE_FALLBACK = os.environ.get('GEOCODE_REMOTE_FALLBACK', '').lower() in ('1', 'true', 'yes')
+
+# Feed retrieval shortlists by Hamming distance over the 1-bit embedding_bits before the exact
+# re-rank, instead of using the HNSW index. See `manage.py benchmark_embedding_retrieval`.
+# Run `manage.py backfill_embedding_bits` first: profiles without bits are left out.
+FEED_QUANTIZED_RETRIEVAL = os.environ.get('FEED_QUANTIZED_RETRIEVAL', '').lower() in ('1', 'true', 'yes')
+
 AUTH_PASSWORD_VALIDATORS = [
     { 'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator' },
     { 'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator' },